@@ -6,19 +6,25 @@ Description: Houses code for the Animal and Field classes
 
 import random as rnd
 import copy
+import json
+import os
 import numpy as np
 
 class Animal:
-    def __init__(self, animal_type, field_size, wrap, **kwargs):
+    def __init__(self, animal_type, field_size, wrap, rng=None, x=None, y=None, **kwargs):
         """Constructor for animal
         :param animal_type: defines whether the animal is a rabbit or fox
         :param field_size: defines the size of the field the animals are in
         :param wrap: True or False whether animals can wrap to other side of the field
+        :param rng: random.Random used for all of the animal's random choices (defaults to the global random module)
+        :param x: starting x location, random if not given
+        :param y: starting y location, random if not given
         :param kwargs: User defines the max cycles that foxes can go without eating
         """
         self.field_size = field_size
-        self.x = rnd.randrange(0, self.field_size)
-        self.y = rnd.randrange(0, self.field_size)
+        self.rng = rnd if rng is None else rng
+        self.x = self.rng.randrange(0, self.field_size) if x is None else x
+        self.y = self.rng.randrange(0, self.field_size) if y is None else y
         self.wrap = wrap
 
         self.type = animal_type
@@ -32,7 +38,8 @@ class Animal:
 
     def reproduce(self):
         """Reproduces the animal"""
-        return copy.deepcopy(self)
+        # shallow copy so the offspring keeps drawing from the same random generator as its parent
+        return copy.copy(self)
 
     def eat(self, amount):
         """Animal eats, resetting generations since eaten"""
@@ -48,31 +55,51 @@ class Animal:
             move_range = [-2, -1, 0, 1, 2]
 
         if self.wrap:     # if wrap is true, allow animal to wrap around field
-            self.x = (self.x + rnd.choice(move_range)) % self.field_size
-            self.y = (self.y + rnd.choice(move_range)) % self.field_size
+            self.x = (self.x + self.rng.choice(move_range)) % self.field_size
+            self.y = (self.y + self.rng.choice(move_range)) % self.field_size
         else:
-            self.x = min(self.field_size - 1, max(0, (self.x + rnd.choice(move_range))))
-            self.y = min(self.field_size - 1, max(0, (self.y + rnd.choice(move_range))))
+            self.x = min(self.field_size - 1, max(0, (self.x + self.rng.choice(move_range))))
+            self.y = min(self.field_size - 1, max(0, (self.y + self.rng.choice(move_range))))
 
 
 class Field:
     """ A field is a patch of grass with 0 or more animals hopping around
     in search of food """
 
-    def __init__(self, growth_rate, size):
+    def __init__(self, growth_rate, size, seed=None):
         """Constructor for field
         :param growth_rate: Defines growth rate of grass
         :param size: defines size of field
+        :param seed: seed for the field's random generators, same seed replays the same simulation
         """
         self.size = size
         self.field = np.ones(shape=(self.size, self.size), dtype=int)
         self.animals = []   # intialize array of animals in field
         self.growth_rate = growth_rate
+        self.gen = 0  # number of generations run so far
+
+        # per-field generators: rng drives the animals, np_rng drives grass growth
+        self.rng = rnd.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
 
     def add_animal(self, animal):
-        """adds an animal to the array of animals"""
+        """adds an animal to the array of animals
+        an Animal created without rng=field.rng drew its starting location from the global random module,
+        so use add_animals to place new animals reproducibly"""
+        animal.rng = self.rng  # animals in the field share the field's generator
         self.animals.append(animal)
 
+    def add_animals(self, animal_type, n, wrap, fox_max_cycles=0):
+        """adds n animals of a type at random locations drawn from the field's generator
+        :param animal_type: whether the animals are rabbits or foxes
+        :param n: number of animals to add
+        :param wrap: True or False whether the animals can wrap to other side of the field
+        :param fox_max_cycles: max cycles that foxes can go without eating
+        """
+        for _ in range(n):
+            self.add_animal(Animal(animal_type=animal_type, field_size=self.size, wrap=wrap, rng=self.rng,
+                                   fox_max_cycles=fox_max_cycles))
+
     def move(self):
         """Moves all animals in the field"""
         for animal in self.animals:
@@ -107,7 +134,7 @@ class Field:
 
             # only animals that have eaten in the current generation can reproduce
             if animal.type == 'rabbit' and animal.k_cycles == 0:  # rabbits can have 1 or 2 children
-                offspring_count = rnd.randint(1, 2)
+                offspring_count = self.rng.randint(1, 2)
             elif animal.type == 'fox' and animal.k_cycles == 0:  # foxes can have 1 child
                 offspring_count = 1
 
@@ -118,7 +145,7 @@ class Field:
 
     def grow(self):
         """Grow back grass"""
-        growloc = (np.random.rand(self.size, self.size) < self.growth_rate) * 1  # produce grass at the rate of grass growth
+        growloc = (self.np_rng.random((self.size, self.size)) < self.growth_rate) * 1  # produce grass at the rate of grass growth
         self.field = np.maximum(self.field, growloc)  # return the new field
 
     def generation(self):
@@ -129,6 +156,73 @@ class Field:
         self.reproduce()
         self.grow()
         self.get_total_field()
+        self.gen += 1
+
+    def run(self, n, checkpoint_every=None, checkpoint_path=None):
+        """Run n generations, optionally writing a checkpoint every so often
+        :param n: number of generations to run
+        :param checkpoint_every: write a checkpoint after every this many generations
+        :param checkpoint_path: file the checkpoint is written to
+        """
+        if checkpoint_every and checkpoint_path is None:
+            raise ValueError('checkpoint_every needs a checkpoint_path to write the checkpoints to')
+        for _ in range(n):
+            self.generation()
+            if checkpoint_every and self.gen % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint_path)
+
+    def save_checkpoint(self, path):
+        """Save the grass grid, the animals, and the random generator states to a binary .npz file
+        :param path: file to write the checkpoint to
+        """
+        version, internal, gauss = self.rng.getstate()
+        rng_state = {'rng': [version, list(internal), gauss], 'np_rng': self.np_rng.bit_generator.state}
+
+        # write to a temporary file first so an interruption never leaves a half-written checkpoint
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            np.savez_compressed(
+                file,
+                size=self.size,
+                growth_rate=self.growth_rate,
+                gen=self.gen,
+                field=self.field.astype(np.uint8),
+                animal_type=np.array([a.type for a in self.animals], dtype='<U6'),
+                x=np.array([a.x for a in self.animals], dtype=np.int32),
+                y=np.array([a.y for a in self.animals], dtype=np.int32),
+                wrap=np.array([a.wrap for a in self.animals], dtype=bool),
+                k_cycles=np.array([a.k_cycles for a in self.animals], dtype=np.int32),
+                max_cycles=np.array([a.max_cycles for a in self.animals], dtype=np.int32),
+                rng_state=json.dumps(rng_state))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load_checkpoint(path):
+        """Restore a field from a checkpoint written by save_checkpoint
+        :param path: checkpoint file to read
+        :return field: Field that continues exactly where the saved one left off
+        """
+        with np.load(path) as data:
+            field = Field(growth_rate=float(data['growth_rate']), size=int(data['size']))
+            field.gen = int(data['gen'])
+            field.field = data['field'].astype(int)
+
+            for animal_type, x, y, wrap, k_cycles, max_cycles in zip(data['animal_type'], data['x'], data['y'],
+                                                                      data['wrap'], data['k_cycles'],
+                                                                      data['max_cycles']):
+                animal = Animal(animal_type=str(animal_type), field_size=field.size, wrap=bool(wrap), x=int(x),
+                                y=int(y), fox_max_cycles=int(max_cycles))
+                animal.k_cycles = int(k_cycles)
+                field.add_animal(animal)
+
+            rng_state = json.loads(str(data['rng_state']))
+
+        version, internal, gauss = rng_state['rng']
+        field.rng.setstate((version, tuple(internal), gauss))
+        field.np_rng.bit_generator.state = rng_state['np_rng']
+        field.get_total_field()
+
+        return field
 
     def get_animals(self, animal_type):
         """Get all animals of a certain type
@@ -143,6 +237,10 @@ class Field:
 
         return animal_list
 
+    def count_animals(self, animal_type):
+        """Count the animals of a certain type"""
+        return sum(1 for animal in self.animals if animal.type == animal_type)
+
     def count_grass(self):
         """Count the amount of grass in the field"""
         unique, counts = np.unique(self.field, return_counts=True)
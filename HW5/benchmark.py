@@ -0,0 +1,115 @@
+"""
+File: benchmark.py
+Description: Times each phase of Field.generation for fixed-seed scenarios at several field sizes
+"""
+import argparse
+import json
+import platform
+import time
+import animal_field as af
+
+# Scenarios, animal counts are per cell so they scale with the field size
+SCENARIOS = {
+    'sparse': {'grass_growth': 0.1, 'rabbits': 0.001, 'foxes': 0.0002, 'k': 10},
+    'rabbit_boom': {'grass_growth': 0.5, 'rabbits': 0.01, 'foxes': 0.0, 'k': 10},
+    'fox_crash': {'grass_growth': 0.02, 'rabbits': 0.005, 'foxes': 0.005, 'k': 3},
+}
+SIZES = [100, 200, 400]  # x/y dimensions of the fields to benchmark
+GENERATIONS = 50  # Number of generations timed for each run
+SEED = 0  # Seed used for every run so results are comparable
+PHASES = ['move', 'eat', 'survive', 'reproduce', 'grow', 'get_total_field']
+
+
+def make_field(scenario, size, seed=SEED):
+    """Create a field populated for a scenario
+    :param scenario: parameters of the scenario
+    :param size: size of the field
+    :param seed: seed for the field's random generators
+    :return field: populated field
+    """
+    field = af.Field(growth_rate=scenario['grass_growth'], size=size, seed=seed)
+    field.add_animals('rabbit', round(scenario['rabbits'] * size * size), True)
+    field.add_animals('fox', round(scenario['foxes'] * size * size), True, fox_max_cycles=scenario['k'])
+    return field
+
+
+def run_scenario(name, size, generations=GENERATIONS):
+    """Run one scenario, timing the phases of every generation separately
+    :param name: name of the scenario
+    :param size: size of the field
+    :param generations: number of generations to run
+    :return result: dictionary of the phase timings and populations
+    """
+    field = make_field(SCENARIOS[name], size)
+    phase_ns = dict.fromkeys(PHASES, 0)
+    start_animals = len(field.animals)
+
+    # same steps as Field.generation, with a timer around each one
+    for _ in range(generations):
+        for phase in PHASES:
+            start = time.perf_counter_ns()
+            getattr(field, phase)()
+            phase_ns[phase] += time.perf_counter_ns() - start
+        field.gen += 1
+
+    total_sec = sum(phase_ns.values()) / 10**9
+    return {
+        'scenario': name,
+        'size': size,
+        'generations': generations,
+        'start_animals': start_animals,
+        'end_rabbits': field.count_animals('rabbit'),
+        'end_foxes': field.count_animals('fox'),
+        'phase_sec': {phase: ns / 10**9 for phase, ns in phase_ns.items()},
+        'total_sec': total_sec,
+        'gen_per_sec': generations / total_sec if total_sec > 0 else None,
+    }
+
+
+def compare(results, baseline):
+    """Print the speedup of each run over the matching run in a baseline report"""
+    base_runs = {(r['scenario'], r['size']): r for r in baseline['results']}
+
+    print("Scenario        Size   Phase               Base(s)    New(s)  Speedup")
+    for result in results:
+        base = base_runs.get((result['scenario'], result['size']))
+        if base is None:
+            continue
+        for phase in PHASES + ['total']:
+            old = base['total_sec'] if phase == 'total' else base['phase_sec'][phase]
+            new = result['total_sec'] if phase == 'total' else result['phase_sec'][phase]
+            speedup = old / new if new > 0 else float('inf')
+            print(f"{result['scenario']:15s} {result['size']:5d}  {phase:15s} {old:10.4f} {new:10.4f} {speedup:8.2f}x")
+
+
+def main():
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(description='Benchmark the phases of the artificial life simulation.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Field sizes to benchmark')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS),
+                        help='Scenarios to benchmark')
+    parser.add_argument('--generations', type=int, default=GENERATIONS, help='Generations to time for each run')
+    parser.add_argument('--output', default='benchmark.json', help='File to write the JSON report to')
+    parser.add_argument('--baseline', default=None, help='Earlier JSON report to compare against')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenarios:
+        for size in args.sizes:
+            result = run_scenario(name, size, args.generations)
+            print(f"{name:15s} {size:5d}  {result['total_sec']:10.4f}s  "
+                  f"rabbits: {result['end_rabbits']} foxes: {result['end_foxes']}")
+            results.append(result)
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'seed': SEED,
+              'results': results}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
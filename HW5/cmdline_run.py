@@ -6,8 +6,12 @@ import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import argparse
 import animal_field as af
+import tiled_field as tf
 import numpy as np
 import matplotlib.colors as colors
+import os
+import queue
+import threading
 
 # Default values for each parameter
 SIZE = 400  # x/y dimensions of the field
@@ -17,24 +21,114 @@ INIT_RABBITS = 40  # Number of starting rabbits
 INIT_FOXES = 10  # Number of starting foxes
 SPEED = 1  # Number of generations per frame
 MAX_FOX_CYCLES = 10  # How many generations foxes can go without food
+FRAMES = 1000  # Number of frames to run
+QUEUE_SIZE = 8  # Max snapshots waiting to be drawn when simulation and rendering run separately
 
 
-def animate(i, field, im):
+def run_generations(field, checkpoint_every=None, checkpoint_path=None):
+    """Run SPEED generations, only asking for checkpoints when there are any since a TiledField can't write them"""
+    if checkpoint_every:
+        field.run(SPEED, checkpoint_every=checkpoint_every, checkpoint_path=checkpoint_path)
+    else:
+        field.run(SPEED)
+
+
+def animate(i, field, im, checkpoint_every=None, checkpoint_path=None):
     """Animation function"""
-    for _ in range(SPEED):
-        field.generation()
+    run_generations(field, checkpoint_every, checkpoint_path)
     im.set_array(field.total_field)
-    plt.title("Generation: " + str(i * SPEED) + " Grass: " + str(field.count_grass()) +
-              " Rabbits: " + str(len(field.get_animals('rabbit'))) +
-              " Foxes: " + str(len(field.get_animals('fox'))))
+    plt.title("Generation: " + str(field.gen) + " Grass: " + str(field.count_grass()) +
+              " Rabbits: " + str(field.count_animals('rabbit')) +
+              " Foxes: " + str(field.count_animals('fox')))
     return im,
 
 
+def snapshot(field, downsample=1):
+    """Capture what is needed to draw one frame
+    :param field: field to capture
+    :param downsample: keep every downsample-th cell in each direction for display
+    :return: (generation, total field, grass count, rabbit count, fox count)
+    """
+    # copy since a TiledField updates its total field in place
+    return (field.gen, field.total_field[::downsample, ::downsample].copy(), field.count_grass(),
+            field.count_animals('rabbit'), field.count_animals('fox'))
+
+
+def simulate(field, frames, snapshots, stop, downsample=1, checkpoint_every=None, checkpoint_path=None):
+    """Producer that runs the simulation in the background and pushes snapshots onto a bounded queue
+    :param field: field to simulate
+    :param frames: number of snapshots to produce, SPEED generations apart
+    :param snapshots: bounded queue the snapshots go into, None is pushed when the run is done
+    :param stop: event that tells the producer to quit early
+    :param downsample: downsampling of the snapshots for display
+    :param checkpoint_every: write a checkpoint every this many generations
+    :param checkpoint_path: file the checkpoint is written to
+    """
+    try:
+        for _ in range(frames):
+            if stop.is_set():
+                return
+            run_generations(field, checkpoint_every, checkpoint_path)
+            _put(snapshots, snapshot(field, downsample), stop)
+    finally:
+        # always tell the consumer the run is over, even when the simulation raised
+        _put(snapshots, None, stop)
+
+
+def _put(snapshots, item, stop):
+    """Put an item on the queue, waiting for room unless told to stop"""
+    while not stop.is_set():
+        try:
+            snapshots.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def latest_snapshots(snapshots):
+    """Frame generator that yields the newest snapshot the simulation has produced on every tick (None when
+    nothing new has arrived yet), and ends once the simulation pushes its None sentinel"""
+    while True:
+        latest = None
+        while True:
+            try:
+                item = snapshots.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                if latest is not None:
+                    yield latest
+                return
+            latest = item
+        yield latest
+
+
+def animate_latest(latest, im):
+    """Animation function that draws the newest snapshot from latest_snapshots"""
+    if latest is not None:
+        gen, total_field, num_grass, num_rabbits, num_foxes = latest
+        im.set_array(total_field)
+        plt.title("Generation: " + str(gen) + " Grass: " + str(num_grass) +
+                  " Rabbits: " + str(num_rabbits) + " Foxes: " + str(num_foxes))
+    return im,
+
+
+def write_frames(snapshots, frames_dir, cmap):
+    """Consumer that writes every snapshot to a numbered png in frames_dir, no GUI needed"""
+    os.makedirs(frames_dir, exist_ok=True)
+    while True:
+        item = snapshots.get()
+        if item is None:
+            break
+        gen, total_field, _, _, _ = item
+        plt.imsave(os.path.join(frames_dir, f'frame_{gen:06d}.png'), total_field, cmap=cmap, vmin=0, vmax=3)
+
+
 def make_plot(field, start_rabbits, start_foxes, field_size):
     """Make a plot after 1000 generations"""
     num_grass = field.count_grass()
-    num_rabbits = len(field.get_animals('rabbit'))
-    num_foxes = len(field.get_animals('fox'))
+    num_rabbits = field.count_animals('rabbit')
+    num_foxes = field.count_animals('fox')
 
     counts_dict = {'Grass': num_grass, 'Rabbits': num_rabbits, 'Foxes': num_foxes}
 
@@ -53,8 +147,21 @@ def main():
     parser.add_argument("--wrap", help="Whether to allow animals to wrap around the field", action="store_true")
     parser.add_argument('--init_rabbits', type=int, default=INIT_RABBITS, help='Number of initial rabbits')
     parser.add_argument('--init_foxes', type=int, default=INIT_FOXES, help='Number of initial foxes')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the random generators, replays the same run')
+    parser.add_argument('--checkpoint', default='field_checkpoint.npz', help='File to write checkpoints to')
+    parser.add_argument('--checkpoint_every', type=int, default=None, help='Write a checkpoint every this many generations')
+    parser.add_argument('--resume', default=None, help='Checkpoint file to resume the simulation from')
+    parser.add_argument('--threaded', action='store_true', help='Run the simulation in a background thread while animating')
+    parser.add_argument('--downsample', type=int, default=1, help='Only display every n-th cell in each direction')
+    parser.add_argument('--queue_size', type=int, default=QUEUE_SIZE, help='Max snapshots waiting to be drawn')
+    parser.add_argument('--frames_dir', default=None, help='Write frames as pngs to this directory instead of showing a GUI')
+    parser.add_argument('--tiles', type=int, default=None, help='Split the field into tiles x tiles pieces run in parallel')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes for a tiled field')
     args = parser.parse_args()
 
+    if args.tiles and (args.resume or args.checkpoint_every):
+        parser.error('checkpoints are not supported with --tiles')
+
     # get all the parse arguments
     grass_growth = args.grass_growth
     max_cycles = args.k
@@ -66,27 +173,66 @@ def main():
     init_rabbits = args.init_rabbits
     init_foxes = args.init_foxes
 
-    # Create the ecosystem
-    field = af.Field(size=size, growth_rate=grass_growth)
-
-    # Initialize with some animals
-    for _ in range(init_rabbits):
-        field.add_animal(af.Animal(animal_type='rabbit', field_size=size, wrap=wrap))
-    for _ in range(init_foxes):
-        field.add_animal(af.Animal(animal_type='fox', fox_max_cycles=max_cycles, field_size=size, wrap=wrap))
-
-    # no grass = black, grass = green, rabbits = blue, foxes = red
-    clist = ['black', 'green', 'blue', 'red']
-    my_cmap = colors.ListedColormap(clist)
-
-    # Set up the image object
-    array = np.zeros(shape=(size, size), dtype=int)
-    fig = plt.figure(figsize=(10, 10))
-    im = plt.imshow(array, cmap=my_cmap, interpolation='hamming', aspect='auto', vmin=0, vmax=3)
-    anim = animation.FuncAnimation(fig, animate, fargs=(field, im), frames=1000, interval=1, repeat=False)
-    plt.show()
-
-    make_plot(field=field, start_foxes=init_foxes, start_rabbits=init_rabbits, field_size=size)
+    if args.resume:
+        # Pick up the ecosystem exactly where the checkpoint left off
+        field = af.Field.load_checkpoint(args.resume)
+        size = field.size
+    elif args.tiles:
+        # Create a tiled ecosystem that runs the tiles in parallel
+        field = tf.TiledField(size=size, growth_rate=grass_growth, tiles=args.tiles, workers=args.workers,
+                              seed=args.seed)
+        field.add_animals('rabbit', init_rabbits, wrap)
+        field.add_animals('fox', init_foxes, wrap, fox_max_cycles=max_cycles)
+    else:
+        # Create the ecosystem
+        field = af.Field(size=size, growth_rate=grass_growth, seed=args.seed)
+
+        # Initialize with some animals
+        field.add_animals('rabbit', init_rabbits, wrap)
+        field.add_animals('fox', init_foxes, wrap, fox_max_cycles=max_cycles)
+
+    try:
+        # no grass = black, grass = green, rabbits = blue, foxes = red
+        clist = ['black', 'green', 'blue', 'red']
+        my_cmap = colors.ListedColormap(clist)
+
+        if args.threaded or args.frames_dir:
+            # Simulation produces snapshots in the background, rendering consumes them
+            snapshots = queue.Queue(maxsize=args.queue_size)
+            stop = threading.Event()
+            producer = threading.Thread(target=simulate, daemon=True,
+                                        args=(field, FRAMES, snapshots, stop, args.downsample, args.checkpoint_every,
+                                              args.checkpoint))
+            producer.start()
+
+            try:
+                if args.frames_dir:
+                    write_frames(snapshots, args.frames_dir, my_cmap)
+                else:
+                    array = np.zeros(shape=(len(range(0, size, args.downsample)),) * 2, dtype=int)
+                    fig = plt.figure(figsize=(10, 10))
+                    im = plt.imshow(array, cmap=my_cmap, interpolation='hamming', aspect='auto', vmin=0, vmax=3)
+                    # runs until the simulation is done, however many ticks that takes
+                    anim = animation.FuncAnimation(fig, animate_latest, frames=latest_snapshots(snapshots),
+                                                   fargs=(im,), interval=1, repeat=False, cache_frame_data=False)
+                    plt.show()
+            finally:
+                # Closing the window early (or an error while drawing) stops the simulation where it is
+                stop.set()
+                producer.join()
+        else:
+            # Set up the image object
+            array = np.zeros(shape=(size, size), dtype=int)
+            fig = plt.figure(figsize=(10, 10))
+            im = plt.imshow(array, cmap=my_cmap, interpolation='hamming', aspect='auto', vmin=0, vmax=3)
+            anim = animation.FuncAnimation(fig, animate, fargs=(field, im, args.checkpoint_every, args.checkpoint),
+                                           frames=FRAMES, interval=1, repeat=False)
+            plt.show()
+
+        make_plot(field=field, start_foxes=init_foxes, start_rabbits=init_rabbits, field_size=size)
+    finally:
+        if args.tiles:
+            field.close()  # a TiledField's worker processes and shared memory are released even after an error
 
 
 if __name__ == '__main__':
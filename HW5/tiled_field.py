@@ -0,0 +1,215 @@
+"""
+File: tiled_field.py
+Description: Houses the TiledField class, a Field split into tiles that are simulated in parallel worker processes
+"""
+
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import os
+import numpy as np
+
+# animals are rows of a structured array instead of Animal objects so whole tiles can be handled at once
+RABBIT = 0
+FOX = 1
+ANIMAL_TYPES = {'rabbit': RABBIT, 'fox': FOX}
+ANIMAL_DTYPE = np.dtype([('x', np.int32), ('y', np.int32), ('type', np.int8), ('k_cycles', np.int32),
+                         ('max_cycles', np.int32), ('wrap', bool)])
+
+_shared = {}  # shared memory name -> (SharedMemory, array), so each process attaches to a grid only once
+
+
+def _array(name, size):
+    """Get the size x size grid stored in the named shared memory block"""
+    if name not in _shared:
+        shm = shared_memory.SharedMemory(name=name)
+        _shared[name] = (shm, np.ndarray((size, size), dtype=np.uint8, buffer=shm.buf))
+    return _shared[name][1]
+
+
+def _tile_generation(task):
+    """Run the eat, survive, reproduce and grow steps for the animals and grass of one tile
+    :param task: (grass name, total field name, field size, tile bounds, growth rate, seed, animals in the tile)
+    :return animals: the animals in the tile after the generation
+    """
+    grass_name, total_name, size, (r0, r1, c0, c1), growth_rate, seed, animals = task
+    grass = _array(grass_name, size)[r0:r1, c0:c1]
+    total = _array(total_name, size)[r0:r1, c0:c1]
+    rng = np.random.default_rng(seed)
+
+    # tile coordinates of every animal, and a single id for the cell it is on
+    lx = animals['x'] - r0
+    ly = animals['y'] - c0
+    cell = lx * (c1 - c0) + ly
+
+    # rabbits eat grass at their location, only the first rabbit on a cell gets the grass
+    rabbit_idx = np.flatnonzero(animals['type'] == RABBIT)
+    rabbit_cells, first = np.unique(cell[rabbit_idx], return_index=True)
+    first_rabbits = rabbit_idx[first]
+    animals['k_cycles'][first_rabbits[grass[lx[first_rabbits], ly[first_rabbits]] > 0]] = 0
+    grass[lx[rabbit_idx], ly[rabbit_idx]] = 0
+
+    # foxes eat every rabbit at their location, the first fox on a cell gets the food
+    fox_idx = np.flatnonzero(animals['type'] == FOX)
+    fox_cells, first = np.unique(cell[fox_idx], return_index=True)
+    animals['k_cycles'][fox_idx[first][np.isin(fox_cells, rabbit_cells)]] = 0
+    eaten = np.zeros(len(animals), dtype=bool)
+    eaten[rabbit_idx[np.isin(cell[rabbit_idx], fox_cells)]] = True
+
+    # get the surviving animals
+    animals = animals[~eaten & (animals['k_cycles'] <= animals['max_cycles'])]
+
+    # only animals that have eaten in the current generation can reproduce, rabbits have 1 or 2 children, foxes 1
+    parents = animals[animals['k_cycles'] == 0]
+    offspring_count = np.where(parents['type'] == RABBIT, rng.integers(1, 3, size=len(parents)), 1)
+    animals = np.concatenate([animals, np.repeat(parents, offspring_count)])
+
+    # grow back grass
+    grass |= rng.random(grass.shape) < growth_rate
+
+    # foxes are 3, rabbits are 2, grass is 1, no grass is 0
+    total[:] = grass
+    rabbits = animals[animals['type'] == RABBIT]
+    total[rabbits['x'] - r0, rabbits['y'] - c0] = 2
+    foxes = animals[animals['type'] == FOX]
+    total[foxes['x'] - r0, foxes['y'] - c0] = 3
+
+    return animals
+
+
+class TiledField:
+    """ A field split into tiles x tiles pieces that are simulated in parallel. The grass and the total
+    field live in shared memory, animals are moved globally and then handed to the tile they landed in,
+    so animals crossing tile boundaries (or wrapping around the field) need no special handling """
+
+    def __init__(self, growth_rate, size, tiles=2, workers=None, seed=None):
+        """Constructor for tiled field
+        :param growth_rate: Defines growth rate of grass
+        :param size: defines size of field
+        :param tiles: number of tiles along each side of the field
+        :param workers: number of worker processes, defaults to the number of cores (1 runs in this process)
+        :param seed: seed for the field's random generators, same seed replays the same simulation
+        """
+        self.size = size
+        self.growth_rate = growth_rate
+        self.tiles = tiles
+        self.tile_size = -(-size // tiles)  # ceiling division so the tiles cover the whole field
+        self.gen = 0  # number of generations run so far
+        self.animals = np.zeros(0, dtype=ANIMAL_DTYPE)
+
+        # tile generators are derived from (entropy, generation, tile) so results don't depend on worker count
+        self.entropy = np.random.SeedSequence(seed).entropy
+        self.rng = np.random.default_rng(self.entropy)
+
+        # grass and total field in shared memory so workers write their tiles in place
+        self._shms = []
+        self.field = self._shared_grid()
+        self.field[:] = 1
+        self.total_field = self._shared_grid()
+        self.total_field[:] = 1
+
+        workers = os.cpu_count() if workers is None else workers
+        self.pool = mp.Pool(workers) if workers > 1 else None
+
+    def _shared_grid(self):
+        """Create a size x size grid in shared memory"""
+        shm = shared_memory.SharedMemory(create=True, size=self.size * self.size)
+        grid = np.ndarray((self.size, self.size), dtype=np.uint8, buffer=shm.buf)
+        _shared[shm.name] = (shm, grid)
+        self._shms.append(shm)
+        return grid
+
+    def add_animal(self, animal):
+        """adds an Animal to the field"""
+        row = np.array([(animal.x, animal.y, ANIMAL_TYPES[animal.type], animal.k_cycles, animal.max_cycles,
+                         animal.wrap)], dtype=ANIMAL_DTYPE)
+        self.animals = np.concatenate([self.animals, row])
+
+    def add_animals(self, animal_type, n, wrap, fox_max_cycles=0):
+        """adds n animals of a type at random locations
+        :param animal_type: whether the animals are rabbits or foxes
+        :param n: number of animals to add
+        :param wrap: True or False whether the animals can wrap to other side of the field
+        :param fox_max_cycles: max cycles that foxes can go without eating
+        """
+        new = np.zeros(n, dtype=ANIMAL_DTYPE)
+        new['x'] = self.rng.integers(0, self.size, size=n)
+        new['y'] = self.rng.integers(0, self.size, size=n)
+        new['type'] = ANIMAL_TYPES[animal_type]
+        new['max_cycles'] = fox_max_cycles if animal_type == 'fox' else 0
+        new['wrap'] = wrap
+        self.animals = np.concatenate([self.animals, new])
+
+    def move(self):
+        """Moves all animals in the field, rabbits up to 1 space and foxes up to 2"""
+        reach = np.where(self.animals['type'] == FOX, 2, 1)
+        wrap = self.animals['wrap']
+        for axis in ('x', 'y'):
+            pos = self.animals[axis] + self.rng.integers(-reach, reach + 1)
+            self.animals[axis] = np.where(wrap, pos % self.size, np.clip(pos, 0, self.size - 1))
+        self.animals['k_cycles'] += 1  # add another generation without food to the animals
+
+    def _tasks(self):
+        """Split the animals by the tile they are in and build one task per tile"""
+        tile_ids = (self.animals['x'] // self.tile_size) * self.tiles + self.animals['y'] // self.tile_size
+        order = np.argsort(tile_ids, kind='stable')
+        splits = np.searchsorted(tile_ids[order], np.arange(1, self.tiles * self.tiles))
+        tile_animals = np.split(self.animals[order], splits)
+
+        tasks = []
+        for tile, animals in enumerate(tile_animals):
+            r0 = (tile // self.tiles) * self.tile_size
+            c0 = (tile % self.tiles) * self.tile_size
+            bounds = (r0, min(r0 + self.tile_size, self.size), c0, min(c0 + self.tile_size, self.size))
+            seed = np.random.SeedSequence(self.entropy, spawn_key=(self.gen, tile))
+            tasks.append((self._shms[0].name, self._shms[1].name, self.size, bounds, self.growth_rate, seed,
+                          animals))
+        return tasks
+
+    def generation(self):
+        """ Run one generation of animal actions """
+        self.move()
+        tasks = self._tasks()
+        if self.pool is None:
+            results = [_tile_generation(task) for task in tasks]
+        else:
+            results = self.pool.map(_tile_generation, tasks)
+        self.animals = np.concatenate(results)
+        self.gen += 1
+
+    def run(self, n):
+        """Run n generations (tiled fields don't write checkpoints)
+        :param n: number of generations to run
+        """
+        for _ in range(n):
+            self.generation()
+
+    def count_animals(self, animal_type):
+        """Count the animals of a certain type"""
+        return int(np.count_nonzero(self.animals['type'] == ANIMAL_TYPES[animal_type]))
+
+    def count_grass(self):
+        """Count the amount of grass in the field"""
+        return int(np.count_nonzero(self.field))
+
+    def close(self):
+        """Shut down the workers and free the shared memory"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+        # the grids have to be released before their shared memory can be closed
+        self.field = None
+        self.total_field = None
+        for shm in self._shms:
+            del _shared[shm.name]
+            shm.close()
+            shm.unlink()
+        self._shms = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -4,102 +4,436 @@ Description: An evolutionary computing framework for multiobjective optimization
 """
 import random as rnd
 import copy
-from functools import reduce
-from profiler import profile
+from collections import OrderedDict
+import multiprocessing as mp
+import os
+import pickle
+from profiler import Profiler, profile
 import time
+import numpy as np
+
+
+_worker_env = None  # Environment holding the agents and objectives inside each worker process
+
+SUCCESS_DECAY = 0.05  # weight of the latest run in each agent's moving average success rate
+MIN_AGENT_WEIGHT = 0.02  # keeps agents that have stopped succeeding from never being picked again
+TIME_CHECK = 64  # evolve only checks the clock every this many iterations
+
+
+def _init_worker(agents, fitness, evaluator, cache_size, cache_key):
+    """Set up a worker process with the agents, objectives and evaluation cache settings of the main Environment"""
+    global _worker_env
+    Profiler.reset()  # forked workers start with a copy of the parent's stats, which the parent already has
+    _worker_env = Environment(cache_size=cache_size, cache_key=cache_key)
+    _worker_env.agents = agents
+    _worker_env.fitness = fitness
+    _worker_env.evaluator = evaluator
+
+
+def _run_batch(task):
+    """Run a batch of random agents starting from a snapshot of the population in a worker process
+    New solutions join the worker's copy of the population so later agents in the batch can build on them
+    :param task: (snapshot of population (evaluation, solution) pairs, number of agent runs, random seed)
+    :return: list of (evaluation, solution) pairs, one per agent run, the profiler stats of the batch and
+    its (hits, misses) in the worker's evaluation cache
+    """
+    snapshot, count, seed = task
+    hits, misses = _worker_env.cache_hits, _worker_env.cache_misses
+    rnd.seed(seed)  # forked workers would otherwise all share the parent's random state
+    _worker_env.clear()
+    for eval, sol in snapshot:
+        _worker_env._add_evaluated(eval, sol)
+    agent_names = list(_worker_env.agents.keys())
+
+    results = []
+    for _ in range(count):
+        op, k, mutates = _worker_env.agents[rnd.choice(agent_names)]
+        new_solution = op(_worker_env.get_random_solutions(k, copy=mutates))
+        eval = _worker_env.evaluate(new_solution)
+        _worker_env._add_evaluated(eval, new_solution)
+        results.append((eval, new_solution))
+    cache_stats = (_worker_env.cache_hits - hits, _worker_env.cache_misses - misses)
+    return results, Profiler.snapshot(reset=True), cache_stats
+
 
 class Environment:
-    def __init__(self):
-        """Environment constructor"""
-        self.pop = {}    # evaluation -> solution  eg: ((cost, 5), (time, 3), (dist, 10))->city sequences
-        # if two solutions have exact same evaluation treat as duplicates so only one solution exists -> keys are unique
+    def __init__(self, reject_dominated=True, cache_size=0, cache_key=None):
+        """Environment constructor
+        reject_dominated: drop new solutions that are dominated by a solution already in the population
+        cache_size: max evaluations remembered so re-generated solutions are not evaluated again, 0 turns it off
+        cache_key: function mapping a solution to a hashable cache key (None means don't cache that solution),
+        by default NumPy arrays are keyed on their raw bytes"""
+        self.clear()
+        self.reject_dominated = reject_dominated
+        self.cache = OrderedDict()  # LRU cache: solution key -> evaluation, least recently used first
+        self.cache_size = cache_size
+        self.cache_key = Environment._solution_key if cache_key is None else cache_key
+        self.cache_hits = 0
+        self.cache_misses = 0
         self.fitness = {}  # objectives/fitness functions: name -> f
-        self.agents = {}   # agents: name -> (operator/function, num_solutions_input)
+        self.evaluator = None  # optional function computing every objective at once: sol -> {name: score}
+        self.agents = {}   # agents: name -> (operator/function, num_solutions_input, mutates_input)
         # number of solutions to feed agent, usually 1 sometimes 2
+        self.agent_success = {}  # agent name -> moving average of how often its solutions were added
+        self.archived = set()  # evaluations already written to the archive file
+
+    def clear(self):
+        """Empty the population"""
+        self.pop = {}    # evaluation -> solution  eg: ((cost, 5), (time, 3), (dist, 10))->city sequences
+        # if two solutions have exact same evaluation treat as duplicates so only one solution exists -> keys are unique
+        self.members = []  # solutions in the same order as the keys of pop, for constant time random picks
+        self.rows = {}  # evaluation -> its position in members and the score matrix
+        self.scores = None  # score matrix, row i holds the scores of the i-th key of pop (extra rows are spare capacity)
 
     def add_fitness_criteria(self, name, f):  # register objectives with population
         """Add or declare an objective to the framework"""
         self.fitness[name] = f
 
-    def add_agent(self, name, op, k=1):  # operator that operates on solutions producing new solutions as output
+    def set_evaluator(self, f):
+        """Register a function that computes all the objectives in one call
+        f returns a dictionary of objective name -> score and is used instead of
+        calling each fitness function separately"""
+        self.evaluator = f
+
+    def add_agent(self, name, op, k=1, mutates=True):  # operator that operates on solutions producing new solutions as output
         """Register a named agent with the framework
         the operator (op) function defines what the agent does
-        k defines the number of input solutions that the agent operates on"""
-        self.agents[name] = (op, k)
+        k defines the number of input solutions that the agent operates on
+        mutates is False for agents that never modify their inputs, so they are handed the population's
+        solutions directly instead of copies"""
+        self.agents[name] = (op, k, mutates)
 
-    def add_solution(self, sol):  # need to evaluate solution as add it to population
-        """Evaluate and add a solution to the population """
-        eval = tuple([(name, f(sol)) for name, f in self.fitness.items()])
+    def evaluate(self, sol):
+        """Evaluate a solution against every objective, returning ((name, score), ...)
+        Solutions already in the evaluation cache are looked up instead of evaluated"""
+        key = self.cache_key(sol) if self.cache_size else None
+        if key is None:
+            return self._evaluate(sol)
+
+        eval = self.cache.get(key)
+        if eval is not None:
+            self.cache.move_to_end(key)
+            self.cache_hits += 1
+            return eval
+
+        self.cache_misses += 1
+        eval = self._evaluate(sol)
+        self.cache[key] = eval
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)  # throw out the least recently used evaluation
+        return eval
+
+    @staticmethod
+    def _solution_key(sol):
+        """Default cache key, the shape, type and bytes of a NumPy array of numbers"""
+        if isinstance(sol, np.ndarray) and sol.dtype != object:
+            return sol.shape, sol.dtype.str, sol.tobytes()
+        return None
+
+    def _evaluate(self, sol):
+        """Evaluate a solution against every objective"""
+        if self.evaluator is not None:
+            scores = self.evaluator(sol)
+            return tuple([(name, scores[name]) for name in self.fitness])
+        return tuple([(name, f(sol)) for name, f in self.fitness.items()])
         # for each name and function, create tuple with name and evauluation of function
+
+    def add_solution(self, sol):  # need to evaluate solution as add it to population
+        """Evaluate and add a solution to the population, returns True if it was new and not dominated"""
+        return self._add_evaluated(self.evaluate(sol), sol)
+
+    def _add_evaluated(self, eval, sol):
+        """Add a solution that has already been evaluated to the population
+        returns True if it brought a new evaluation into the population"""
+        row = self.rows.get(eval)
+        if row is not None:
+            self.members[row] = sol  # same evaluation, the newer solution replaces the old one
+            self.pop[eval] = sol
+            return False
+
+        scores = [score for _, score in eval]
+        if self.reject_dominated and self.size() > 0 and \
+                Environment._is_dominated(self.scores[:self.size()], scores):
+            return False
+        self._add_scores(scores)
+        self.rows[eval] = len(self.members)
+        self.members.append(sol)
         self.pop[eval] = sol
+        return True
+
+    def _add_scores(self, scores):
+        """Append a row to the score matrix, doubling its capacity when it is full"""
+        n = self.size()
+        if self.scores is None:
+            self.scores = np.empty((16, len(scores)))
+        elif n == len(self.scores):
+            self.scores = np.concatenate([self.scores, np.empty_like(self.scores)])
+        self.scores[n] = scores
 
     def size(self):
         """Size of current population"""
         return len(self.pop)
 
-    def get_random_solutions(self, k=1):
-        """Pick k random solutions from the population and return as list"""
+    def get_random_solutions(self, k=1, copy=True):
+        """Pick k random solutions from the population and return as list
+        copy=False returns the population's own solutions, only for callers that won't modify them"""
         if self.size() == 0:
             return []
-        else:
-            popvals = tuple(self.pop.values())
-            return [copy.deepcopy(rnd.choice(popvals)) for _ in range(k)]  # generate random choice and return copied solutions
+        picks = [self.members[rnd.randrange(len(self.members))] for _ in range(k)]
+        if copy:
+            return [Environment._copy(sol) for sol in picks]
+        return picks
+
+    @staticmethod
+    def _copy(sol):
+        """Copy a solution, NumPy arrays of numbers only need ndarray.copy"""
+        if isinstance(sol, np.ndarray) and sol.dtype != object:
+            return sol.copy()
+        return copy.deepcopy(sol)
 
     def run_agent(self, name):
         """Invoke an agent against the population"""
-        op, k = self.agents[name]
-        picks = self.get_random_solutions(k)
+        op, k, mutates = self.agents[name]
+        picks = self.get_random_solutions(k, copy=mutates)
         new_solution = op(picks)  # agents always take in a list of solutions
-        self.add_solution(new_solution)
+        return self.add_solution(new_solution)
 
     @staticmethod
-    def _dominates(p, q):
-        """p, q are the evaluations of the solutions (not actual solutions)"""
-        pscores = [score for _, score in p]  # extracting out p and q scores
-        qscores = [score for _, score in q]
+    def _is_dominated(S, q):
+        """True if any row of the score matrix S dominates the scores q (assuming minimization)
+        p dominates q if p is at least as good as q for every objective but strictly better at one objective"""
+        return bool(((S <= q).all(axis=1) & (S < q).any(axis=1)).any())
 
-        score_diffs = list(map(lambda x, y: y - x, pscores, qscores))  # compute all differences
+    @staticmethod
+    def _nondominated(S, block=256):
+        """Boolean mask of the rows of the score matrix S that no other row dominates
+        dominance is checked block by block so memory stays at block x n x objectives"""
+        dominated = np.zeros(len(S), dtype=bool)
+        for start in range(0, len(S), block):
+            P = S[start:start + block, None, :]  # a block of potential dominators against every row
+            dominated |= ((P <= S).all(axis=2) & (P < S).any(axis=2)).any(axis=0)
+        return ~dominated
 
-        min_diff = min(score_diffs)
-        max_diff = max(score_diffs)
+    def remove_dominated(self):
+        """Throw out every solution dominated by another solution in the population"""
+        n = self.size()
+        if n == 0:
+            return
+        keep = Environment._nondominated(self.scores[:n])
+        # rebuild the pop dictionary, members and score matrix with just the non dominated keys, in the same order
+        self.pop = {k: sol for (k, sol), nd in zip(self.pop.items(), keep) if nd}
+        self.members = list(self.pop.values())
+        self.rows = {k: i for i, k in enumerate(self.pop)}
+        self.scores[:len(self.pop)] = self.scores[:n][keep]
 
-        return min_diff >= 0.0 and max_diff > 0.0  # assuming minimization
-        # try to capture idea of p dominates q if p is at least as good as q for every objective but strictly better at one objective
+    def save_archive(self, path, rewrite=False):
+        """Append the non-dominated solutions that are not in the archive file yet to it
+        The file is a sequence of .npy records: a header with the objective names, then per snapshot
+        the score matrix of the new solutions followed by the solutions themselves, so each snapshot
+        only costs what changed and an interrupted write can only lose the last snapshot
+        (a solution that later gets replaced by one with the same evaluation keeps its archived version)
+        :param path: archive file, created if it doesn't exist
+        :param rewrite: replace the file with just the current population (drops solutions that have since
+        been dominated), written to a temporary file first so the old archive survives an interruption
+        :return: number of solutions written
+        """
+        self.remove_dominated()
+        if rewrite or not os.path.exists(path):
+            self.archived = set()
+            target = path + '.tmp'
+            mode = 'wb'
+        else:
+            self.archived &= self.pop.keys()  # forget solutions that have been thrown out since
+            target = path
+            mode = 'ab'
 
-    @staticmethod
-    def _reduce_nds(S, p):
-        return S - {q for q in S if Environment._dominates(p, q)}
-    # find all other points q, where p dominates q, then subtract dominated points from set
+        new = [(eval, sol) for eval, sol in self.pop.items() if eval not in self.archived]
+        with open(target, mode) as file:
+            if mode == 'wb':
+                np.save(file, np.array(list(self.fitness)))
+            if new:
+                np.save(file, np.array([[score for _, score in eval] for eval, _ in new]))
+                sols = [sol for _, sol in new]
+                if all(isinstance(sol, np.ndarray) and sol.dtype != object and sol.shape == sols[0].shape
+                       for sol in sols):
+                    np.save(file, np.stack(sols))
+                else:  # any other solutions are pickled one by one into an object array
+                    objects = np.empty(len(sols), dtype=object)
+                    for j, sol in enumerate(sols):
+                        objects[j] = sol
+                    np.save(file, objects, allow_pickle=True)
+            file.flush()
+            os.fsync(file.fileno())
+        if target != path:
+            os.replace(target, path)
 
-    def remove_dominated(self):
-        nds = reduce(Environment._reduce_nds, self.pop.keys(), self.pop.keys())
-        # start with population keys, then boil down to non dominated keys
-        self.pop = {k:self.pop[k] for k in nds}
-        # figuring out which keys are non dominated, then looking at solution for keys and rebuilding pop dictionary
-        # just has keys from non dominated set, throw out dominated solutions
+        self.archived.update(eval for eval, _ in new)
+        return len(new)
+
+    def load_archive(self, path):
+        """Add every solution in an archive file to the population and throw out the dominated ones
+        A snapshot that was cut off by an interruption is dropped from the end of the file
+        :return: number of solutions read
+        """
+        read = 0
+        with open(path, 'r+b') as file:
+            names = [str(name) for name in np.load(file)]
+            good = file.tell()  # end of the last complete snapshot
+            while True:
+                try:
+                    scores = np.load(file)
+                    sols = np.load(file, allow_pickle=True)
+                except (EOFError, ValueError, OSError, pickle.UnpicklingError):
+                    break
+                good = file.tell()
+                for row, sol in zip(scores.tolist(), sols):
+                    eval = tuple(zip(names, row))
+                    self._add_evaluated(eval, sol)
+                    self.archived.add(eval)
+                read += len(scores)
+            file.truncate(good)
+        self.remove_dominated()
+        return read
+
+    def _archive(self, archive, archive_every, i, prev):
+        """Snapshot the non-dominated solutions whenever another archive_every iterations have gone by"""
+        if archive is not None and i // archive_every > prev // archive_every:
+            self.save_archive(archive)
 
     @profile
-    def evolve(self, n=1, dom=100, status=100, time_max=600):
-        current_time = time.time_ns()
+    def evolve(self, n=1, dom=100, status=100, time_max=600, adaptive=False, growth=2.0, progress=None,
+               archive=None, archive_every=10000):
+        """Run n random agents (or until time_max seconds) and return the number of agents run
+        :param dom: remove dominated solutions every dom iterations (only when adaptive is False)
+        :param status: send a progress event every status iterations, never if None
+        :param time_max: stop after this many seconds
+        :param adaptive: pick agents by their recent success at adding new non-dominated solutions
+        and remove dominated solutions whenever the population has grown by the growth factor (instead of every
+        dom iterations), the success rates carry over to later calls so evolving in chunks keeps what was learned
+        :param growth: population growth since the last pruning that triggers the next one
+        :param progress: function called with each progress event (a dictionary), prints one line by default
+        :param archive: file the non-dominated solutions are appended to every archive_every iterations and
+        at the end, see save_archive
+        """
+        start = time.perf_counter()
+        progress = Environment.print_progress if progress is None else progress
 
         agent_names = list(self.agents.keys())
+        for name in agent_names:
+            self.agent_success.setdefault(name, 1.0)  # optimistic start so every new agent gets tried
+        pruned_size = self.size()
+        added = 0
 
+        i = -1
         for i in range(n):
-            pick = rnd.choice(agent_names)
-            self.run_agent(pick)
+            if adaptive:
+                weights = [max(self.agent_success[name], MIN_AGENT_WEIGHT) for name in agent_names]
+                pick = rnd.choices(agent_names, weights)[0]
+            else:
+                pick = rnd.choice(agent_names)
+            success = self.run_agent(pick)
+            added += success
+            self.agent_success[pick] += SUCCESS_DECAY * (success - self.agent_success[pick])
 
-            if i % dom == 0:  # every dom number of generations remove dominated points
+            if adaptive:
+                if self.size() >= growth * max(pruned_size, 1):  # prune once the population has grown enough
+                    self.remove_dominated()
+                    pruned_size = self.size()
+            elif i % dom == 0:  # every dom number of generations remove dominated points
                 self.remove_dominated()
 
-            if i % status == 0:
-                print("Iteration:", i)
-                print("Population Size:", self.size())
-                print(self)
+            if status and i % status == 0:
+                progress(self._progress_event(i, start, added))
 
-            if (time.time_ns() - current_time)/10**9 > time_max:
+            self._archive(archive, archive_every, i + 1, i)
+
+            if i % TIME_CHECK == 0 and time.perf_counter() - start > time_max:
                 break
 
         self.remove_dominated()  # cleaning up population one last time
+        if archive is not None:
+            self.save_archive(archive)
+        return i + 1
+
+    def _progress_event(self, i, start, added):
+        """Build a progress event without touching the solutions themselves"""
+        return {'iteration': i, 'seconds': time.perf_counter() - start, 'population': self.size(),
+                'added': added, 'agent_success': dict(self.agent_success)}
+
+    @staticmethod
+    def print_progress(event):
+        """Default progress handler, one line per event"""
+        success = ' '.join(f'{name}={rate:.2f}' for name, rate in event['agent_success'].items())
+        print(f"Iteration: {event['iteration']} Time: {event['seconds']:.1f}s Population Size: {event['population']} "
+              f"Added: {event['added']} Agent success: {success}")
+
+    @profile
+    def evolve_parallel(self, n=1, workers=None, batch=100, dom=100, status=100, time_max=600, progress=None,
+                        archive=None, archive_every=10000):
+        """Evolve with agent runs and their evaluations spread over a pool of worker processes
+        Each round every worker gets a snapshot of the population and runs a batch of agents starting from it,
+        the (evaluation, solution) pairs it returns are then added to the population here
+        :param n: total number of agent runs
+        :param workers: number of worker processes, defaults to the number of cores
+        :param batch: agent runs per worker per round
+        :param dom: remove dominated solutions every dom agent runs
+        :param status: send a progress event every status agent runs, never if None
+        :param time_max: stop after this many seconds
+        :param progress: function called with each progress event (a dictionary), prints one line by default
+        :param archive: file the non-dominated solutions are appended to every archive_every agent runs and
+        at the end, see save_archive
+        :return i: number of agents run
+        """
+        start = time.perf_counter()
+        progress = Environment.print_progress if progress is None else progress
+        workers = os.cpu_count() if workers is None else workers
+        added = 0
+
+        initargs = (self.agents, self.fitness, self.evaluator, self.cache_size, self.cache_key)
+        with mp.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            i = 0
+            while i < n:
+                snapshot = list(self.pop.items())
+                tasks = []
+                for _ in range(workers):
+                    count = min(batch, n - i - sum(task[1] for task in tasks))
+                    if count > 0:
+                        tasks.append((snapshot, count, rnd.getrandbits(64)))
+
+                for results, stats, (hits, misses) in pool.map(_run_batch, tasks):
+                    Profiler.merge(stats)
+                    self.cache_hits += hits  # the evaluations happened in the workers' caches
+                    self.cache_misses += misses
+                    for eval, sol in results:
+                        added += self._add_evaluated(eval, sol)
+
+                prev, i = i, i + sum(task[1] for task in tasks)
+
+                if i // dom > prev // dom:  # remove dominated points whenever another dom runs have gone by
+                    self.remove_dominated()
+
+                if status and i // status > prev // status:
+                    progress(self._progress_event(i, start, added))
+
+                self._archive(archive, archive_every, i, prev)
+
+                if time.perf_counter() - start > time_max:
+                    break
+
+        self.remove_dominated()  # cleaning up population one last time
+        if archive is not None:
+            self.save_archive(archive)
+        return i
+
+    def cache_report(self):
+        """ Summarize how often the evaluation cache saved an evaluation
+        after evolve_parallel the hits and misses are summed over the workers' caches, while Size is this cache's """
+        if self.cache_size == 0:
+            return
+        lookups = self.cache_hits + self.cache_misses
+        rate = self.cache_hits / lookups if lookups > 0 else 0.0
+        print("Cache     Hits   Misses  HitRate     Size")
+        print(f"{'':5s} {self.cache_hits:8d} {self.cache_misses:8d} {rate:8.2%} {len(self.cache):8d}")
 
     def __str__(self):
         """ Output the solutions in the population """
@@ -0,0 +1,170 @@
+"""
+File: islands.py
+Description: Island model for the evolutionary framework, several Environments evolve
+in separate processes and periodically swap their non-dominated solutions
+"""
+import multiprocessing as mp
+import queue
+import random as rnd
+import time
+import traceback
+import numpy as np
+from profiler import Profiler
+
+RESULT_WAIT = 1.0  # seconds the coordinator waits for a result before checking the island processes are alive
+
+
+def _neighbors(topology, islands):
+    """Map each island to the islands it sends migrants to
+    topology is 'ring' (each island sends to the next one), 'all' (every island sends to every other island)
+    or a dictionary island -> list of islands"""
+    if topology == 'ring':
+        return {i: [(i + 1) % islands] for i in range(islands)} if islands > 1 else {0: []}
+    elif topology == 'all':
+        return {i: [j for j in range(islands) if j != i] for i in range(islands)}
+    return topology
+
+
+def _run_island(island, make_env, inbox, outboxes, senders, results, n, migrate_every, migrants, dom, time_max,
+                seed, adaptive):
+    """Evolve one island, sending migrants after every migrate_every iterations and taking in any that arrived
+    (island, final population, the island's stats, its profiler stats, None) is put on the results queue,
+    or (island, None, None, None, traceback) if the island failed"""
+    done = 0  # number of senders that have finished
+    try:
+        Profiler.reset()  # forked islands start with a copy of the coordinator's stats
+        rnd.seed(None if seed is None else seed + island)  # forked islands would otherwise share one random state
+        np.random.seed(None if seed is None else seed + island)
+
+        env = make_env()
+        start = time.time_ns()
+        iterations = sent = received = 0
+
+        while iterations < n:
+            remaining = time_max - (time.time_ns() - start) / 10**9
+            if remaining <= 0:
+                break
+            iterations += env.evolve(min(migrate_every, n - iterations), dom=dom, status=None, time_max=remaining,
+                                     adaptive=adaptive)
+
+            # send some of the non-dominated solutions to the neighbors
+            emigrants = list(env.pop.items())
+            if migrants is not None and len(emigrants) > migrants:
+                emigrants = rnd.sample(emigrants, migrants)
+            for outbox in outboxes:
+                outbox.put(emigrants)
+                sent += len(emigrants)
+
+            # take in whatever has arrived without waiting on the other islands
+            while True:
+                try:
+                    immigrants = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                if immigrants is None:
+                    done += 1
+                    continue
+                for eval, sol in immigrants:
+                    env._add_evaluated(eval, sol)
+                received += len(immigrants)
+
+        # tell the neighbors this island is done, then keep reading until every sender is done too,
+        # since a process can't exit while data it put on a queue is still unread
+        for outbox in outboxes:
+            outbox.put(None)
+        while done < senders:
+            immigrants = inbox.get()
+            if immigrants is None:
+                done += 1
+                continue
+            for eval, sol in immigrants:
+                env._add_evaluated(eval, sol)
+            received += len(immigrants)
+
+        env.remove_dominated()
+        sec = (time.time_ns() - start) / 10**9
+        stats = {'island': island, 'iterations': iterations, 'seconds': sec,
+                 'iterations_per_sec': iterations / sec if sec > 0 else 0.0,
+                 'sent': sent, 'received': received, 'population': env.size()}
+        results.put((island, list(env.pop.items()), stats, Profiler.snapshot(), None))
+    except BaseException:
+        # still send the sentinels and drain the inbox so the neighbors don't wait on this island forever
+        results.put((island, None, None, None, traceback.format_exc()))
+        for outbox in outboxes:
+            outbox.put(None)
+        while done < senders:
+            done += inbox.get() is None
+
+
+class IslandModel:
+    def __init__(self, make_env, islands=4, topology='ring', migrate_every=1000, migrants=None):
+        """IslandModel constructor
+        make_env: function that creates a ready to evolve Environment (objectives, agents and starting solutions)
+        islands: number of islands, each runs in its own process
+        topology: 'ring', 'all' or a dictionary island -> list of islands it sends migrants to
+        migrate_every: iterations each island runs between migrations
+        migrants: max solutions sent per migration, all non-dominated solutions if None"""
+        self.make_env = make_env
+        self.islands = islands
+        self.neighbors = _neighbors(topology, islands)
+        self.migrate_every = migrate_every
+        self.migrants = migrants
+        self.stats = []  # per island stats from the last run
+
+    def evolve(self, n=1, dom=100, time_max=600, seed=None, adaptive=False):
+        """Evolve every island for n iterations (or time_max seconds) and merge their populations
+        adaptive is passed on to each island's Environment.evolve, dom is only used when it is False
+        :return E: Environment holding the non-dominated solutions across all islands
+        """
+        inboxes = [mp.Queue() for _ in range(self.islands)]
+        results = mp.Queue()
+        senders = [sum(i in targets for targets in self.neighbors.values()) for i in range(self.islands)]
+        procs = [mp.Process(target=_run_island,
+                            args=(i, self.make_env, inboxes[i], [inboxes[j] for j in self.neighbors[i]], senders[i],
+                                  results, n, self.migrate_every, self.migrants, dom, time_max, seed, adaptive))
+                 for i in range(self.islands)]
+        for p in procs:
+            p.start()
+
+        # collect before joining, a process with unread data on a queue can't exit
+        finals = []
+        try:
+            while len(finals) < len(procs):
+                try:
+                    island, pop, stats, profiler_stats, error = results.get(timeout=RESULT_WAIT)
+                except queue.Empty:
+                    # a process that was killed or crashed hard never reports, so check on them now and then
+                    for i, p in enumerate(procs):
+                        if p.exitcode not in (None, 0):
+                            raise RuntimeError(f'Island {i} exited with code {p.exitcode} without a result')
+                    continue
+                if error is not None:
+                    raise RuntimeError(f'Island {island} failed:\n{error}')
+                finals.append((pop, stats, profiler_stats))
+        except BaseException:
+            for p in procs:
+                p.terminate()
+            raise
+        finally:
+            for p in procs:
+                p.join()
+
+        # final Pareto merge of every island's population, into an Environment set up like the islands'
+        # (objectives, evaluator and agents) so it can be archived or evolved further
+        E = self.make_env()
+        E.clear()
+        for pop, _, profiler_stats in finals:
+            Profiler.merge(profiler_stats)
+            for eval, sol in pop:
+                E._add_evaluated(eval, sol)
+        E.remove_dominated()
+
+        self.stats = sorted([stats for _, stats, _ in finals], key=lambda s: s['island'])
+        return E
+
+    def report(self):
+        """ Summarize iterations, throughput and migration for each island """
+        print("Island  Iterations   Seconds     Iter/Sec     Sent  Received  PopSize")
+        for s in self.stats:
+            print(f"{s['island']:6d} {s['iterations']:11d} {s['seconds']:9.2f} {s['iterations_per_sec']:12.1f} "
+                  f"{s['sent']:8d} {s['received']:9d} {s['population']:8d}")
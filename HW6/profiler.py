@@ -4,38 +4,253 @@ Description: Using decorators to build out a
 well-functioned profiling tool
 """
 from collections import defaultdict
+import functools
+import json
+import threading
 import time
 
+SUB_BITS = 4  # each power of two of nanoseconds is split into 2**SUB_BITS linear histogram buckets
+
+
+def _bucket(ns):
+    """Lower bound and width in ns of the log-linear histogram bucket holding a duration, the bucket
+    width is at most 1/2**SUB_BITS of the durations in it so a percentile is never off by more than that"""
+    shift = max(ns.bit_length() - 1 - SUB_BITS, 0)
+    return ns >> shift << shift, 1 << shift
+
 
 def profile(f):
     return Profiler.profile(f)
 
 
+class _Stats:
+    """Everything recorded by one thread (or merged from several threads and processes)"""
+
+    def __init__(self):
+        self.calls = defaultdict(int)  # func name --> # calls
+        self.time = defaultdict(float) # func name --> # total time
+        self.timed = defaultdict(int)  # func name --> # calls that were actually timed (fewer than calls when sampling)
+        self.hist = defaultdict(int)  # (func name, bucket lower bound in ns) --> # timed calls that took that long
+        self.fastest = {}  # func name --> shortest timed call in ns
+        self.slowest = {}  # func name --> longest timed call in ns
+
+        self.tree_calls = defaultdict(int)  # call path (outer func, ..., func) --> # calls
+        self.tree_time = defaultdict(float)  # call path --> inclusive time
+        self.tree_child_time = defaultdict(float)  # call path --> time spent in profiled functions it called
+
+        self.stack = []  # [call path, child ns] for the calls this thread is in the middle of
+
+    def tables(self):
+        """The recorded tables, copied so they can be read while the owning thread keeps running"""
+        return {'calls': dict(self.calls), 'time': dict(self.time), 'timed': dict(self.timed), 'hist': dict(self.hist),
+                'fastest': dict(self.fastest), 'slowest': dict(self.slowest),
+                'tree_calls': dict(self.tree_calls), 'tree_time': dict(self.tree_time),
+                'tree_child_time': dict(self.tree_child_time)}
+
+    def merge(self, tables):
+        """Add tables from another thread or process to these stats"""
+        for table, values in tables.items():
+            mine = getattr(self, table)
+            for key, value in values.items():
+                if table == 'fastest':
+                    mine[key] = min(mine.get(key, value), value)
+                elif table == 'slowest':
+                    mine[key] = max(mine.get(key, value), value)
+                else:
+                    mine[key] += value
+
+    def clear(self):
+        for table in self.tables():
+            getattr(self, table).clear()
+
+
 class Profiler:
 
-    calls = defaultdict(int)  # func name --> # calls
-    time = defaultdict(float) # func name --> # total time
+    enabled = True  # when False profiled functions are called straight through
+    mode = 'flat'  # 'flat' times every call, 'sample' times 1 in sample_every calls, 'tree' also records the callers
+    sample_every = 100
+
+    _local = threading.local()  # this thread's _Stats, so recording a call never needs a lock
+    _threads = []  # _Stats of every thread that has recorded anything
+    _imported = _Stats()  # stats merged in from other processes
+    _lock = threading.Lock()  # guards _threads and _imported
+
+    @staticmethod
+    def configure(enabled=None, mode=None, sample_every=None):
+        """Change how profiling is done while the program is running"""
+        if enabled is not None:
+            Profiler.enabled = enabled
+        if mode is not None:
+            Profiler.mode = mode
+        if sample_every is not None:
+            Profiler.sample_every = sample_every
+
+    @staticmethod
+    def reset():
+        """Throw away everything recorded so far"""
+        with Profiler._lock:
+            for stats in Profiler._threads + [Profiler._imported]:
+                stats.clear()
+
+    @staticmethod
+    def _stats():
+        """Get this thread's stats, registering them the first time the thread records anything"""
+        stats = getattr(Profiler._local, 'stats', None)
+        if stats is None:
+            stats = Profiler._local.stats = _Stats()
+            with Profiler._lock:
+                Profiler._threads.append(stats)
+        return stats
+
+    @staticmethod
+    def _add(stats, function_name, ns):
+        stats.calls[function_name] += 1
+        stats.timed[function_name] += 1
+        stats.time[function_name] += ns / 10**9
+        stats.hist[function_name, _bucket(ns)[0]] += 1
+        if ns < stats.fastest.get(function_name, ns + 1):
+            stats.fastest[function_name] = ns
+        if ns > stats.slowest.get(function_name, -1):
+            stats.slowest[function_name] = ns
 
     @staticmethod
-    def _add(function_name, sec):
-        Profiler.calls[function_name] += 1
-        Profiler.time[function_name] += sec
+    def _call_tree(function_name, f, args, kwargs):
+        """Call f, recording its time under its full call path and charging it to the caller's child time"""
+        stats = Profiler._stats()
+        stack = stats.stack
+        path = (stack[-1][0] if stack else ()) + (function_name,)
+        frame = [path, 0]
+        stack.append(frame)
+        start = time.perf_counter_ns()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            ns = time.perf_counter_ns() - start
+            stack.pop()
+            if stack:
+                stack[-1][1] += ns
+            stats.tree_calls[path] += 1
+            stats.tree_time[path] += ns / 10**9
+            stats.tree_child_time[path] += frame[1] / 10**9
+            Profiler._add(stats, function_name, ns)
 
     @staticmethod
     def profile(f):
+        function_name = f.__module__ + '.' + f.__qualname__  # qualified so same named functions don't collide
+
+        @functools.wraps(f)  # keeps the function's name so profiled functions can still be pickled
         def wrapper(*args, **kwargs):
-            function_name = f.__name__
-            start = time.time_ns()
+            if not Profiler.enabled:
+                return f(*args, **kwargs)
+
+            if Profiler.mode == 'tree':
+                return Profiler._call_tree(function_name, f, args, kwargs)
+
+            stats = Profiler._stats()
+            if Profiler.mode == 'sample':
+                stats.calls[function_name] += 1
+                if (stats.calls[function_name] - 1) % Profiler.sample_every:  # time calls 1, 1 + n, ...
+                    return f(*args, **kwargs)
+                stats.calls[function_name] -= 1  # _add counts this call
+
+            start = time.perf_counter_ns()
             val = f(*args, **kwargs)
-            sec = (time.time_ns() - start) / 10**9
-            Profiler._add(function_name, sec)
+            Profiler._add(stats, function_name, time.perf_counter_ns() - start)
             return val  # OOPS! We forgot this before! Very important!
         return wrapper
 
+    @staticmethod
+    def snapshot(reset=False):
+        """Everything recorded in this process as plain tables, e.g. to send back from a worker process
+        reset=True also clears the recorded stats so the next snapshot only has what happened since"""
+        merged = Profiler.merged()
+        if reset:
+            Profiler.reset()
+        return merged.tables()
+
+    @staticmethod
+    def merge(tables):
+        """Add a snapshot taken in another process to this process's stats"""
+        with Profiler._lock:
+            Profiler._imported.merge(tables)
+
+    @staticmethod
+    def merged():
+        """Stats of every thread in this process plus whatever was merged in from other processes"""
+        merged = _Stats()
+        with Profiler._lock:
+            for stats in Profiler._threads + [Profiler._imported]:
+                merged.merge(stats.tables())
+        return merged
+
+    @staticmethod
+    def _percentiles(stats, name, percents):
+        """Estimate latency percentiles in seconds from a function's log-linear histogram, interpolating
+        within the bucket the percentile falls in and staying between the fastest and slowest calls"""
+        buckets = sorted((low, num) for (func, low), num in stats.hist.items() if func == name)
+        total = sum(num for _, num in buckets)
+        results = []
+        for percent in percents:
+            target = percent / 100 * total
+            seen = 0
+            for low, num in buckets:
+                if seen + num >= target:
+                    ns = low + _bucket(low)[1] * (target - seen) / num
+                    ns = min(max(ns, stats.fastest[name]), stats.slowest[name])
+                    results.append(ns / 10**9)
+                    break
+                seen += num
+            else:
+                results.append(0.0)
+        return results
+
     @staticmethod
     def report():
-        """ Summarize # calls, total runtime, and time/call for each function """
-        print("Function              Calls     TotSec   Sec/Call")
-        for name, num in Profiler.calls.items():
-            sec = Profiler.time[name]
-            print(f'{name:20s} {num:6d} {sec:10.6f} {sec / num:10.6f}')
+        """ Summarize # calls, total runtime, time/call and latency percentiles for each function
+        when sampling, total runtime is estimated from the calls that were timed """
+        stats = Profiler.merged()
+        print("Function                                     Calls     TotSec   Sec/Call        P50        P90        P99")
+        for name, num in stats.calls.items():
+            timed = stats.timed[name]
+            per_call = stats.time[name] / timed if timed else 0.0
+            p50, p90, p99 = Profiler._percentiles(stats, name, (50, 90, 99))
+            print(f'{name:40s} {num:10d} {per_call * num:10.6f} {per_call:10.6f} {p50:10.6f} {p90:10.6f} {p99:10.6f}')
+
+    @staticmethod
+    def report_tree():
+        """ Print the call tree with # calls, inclusive and exclusive time for each call path """
+        stats = Profiler.merged()
+        print("Function                                     Calls    InclSec    ExclSec")
+        for path in sorted(stats.tree_calls):
+            incl = stats.tree_time[path]
+            excl = incl - stats.tree_child_time[path]
+            name = '  ' * (len(path) - 1) + path[-1]
+            print(f'{name:40s} {stats.tree_calls[path]:10d} {incl:10.6f} {excl:10.6f}')
+
+    @staticmethod
+    def export_json(filename):
+        """Write the flat stats, latency percentiles and the call tree to a JSON file"""
+        stats = Profiler.merged()
+        functions = []
+        for name, num in stats.calls.items():
+            p50, p90, p99 = Profiler._percentiles(stats, name, (50, 90, 99))
+            functions.append({'name': name, 'calls': num, 'timed_calls': stats.timed[name],
+                              'total_sec': stats.time[name], 'p50_sec': p50, 'p90_sec': p90, 'p99_sec': p99})
+        report = {
+            'functions': functions,
+            'tree': [{'path': list(path), 'calls': num, 'inclusive_sec': stats.tree_time[path],
+                      'exclusive_sec': stats.tree_time[path] - stats.tree_child_time[path]}
+                     for path, num in stats.tree_calls.items()],
+        }
+        with open(filename, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    @staticmethod
+    def export_flamegraph(filename):
+        """Write the call tree as collapsed stacks ("outer;inner microseconds" per line), the input
+        format of flamegraph.pl and speedscope, using each path's exclusive time"""
+        stats = Profiler.merged()
+        with open(filename, 'w') as file:
+            for path, incl in stats.tree_time.items():
+                excl_us = round((incl - stats.tree_child_time[path]) * 10**6)
+                file.write(';'.join(path) + f' {excl_us}\n')
@@ -3,80 +3,113 @@ File: ta_availibility.py
 Description: Use evolutionary based computing to assign TAs to labs
 """
 from evo import Environment
+from islands import IslandModel
 from profiler import Profiler, profile
 import random as rnd
 import numpy as np
 import pandas as pd
 import csv
+import os
 
 
 sections = pd.read_csv('sections.csv')
 tas = pd.read_csv('tas.csv')
 rows = len(tas)  # get number of TAs to assign
 cols = len(sections)  # get the number of lab sections
+WORKERS = 1  # worker processes for the evolver, more than 1 runs agents in parallel
+ISLANDS = 1  # separate populations evolved in their own processes, more than 1 uses the island model
+CACHE_SIZE = 100000  # max evaluations the evolver remembers for solutions it sees again
+ARCHIVE = 'archive.npy'  # non-dominated solutions are snapshotted here while evolving, by islands only at the end
+RESUME = False  # True picks up from the solutions in ARCHIVE and keeps adding to it, False starts it over
+ARCHIVE_EVERY = 10000  # iterations between archive snapshots
+
+
+# Solutions are bit-packed: each TA's row of 0/1 section assignments is stored as bits in uint8 words
+def pack(array):
+    """Pack a rows x cols 0/1 assignment matrix into a rows x ceil(cols / 8) uint8 solution"""
+    return np.packbits(array.astype(bool), axis=1)
+
+
+def unpack(packed):
+    """Unpack a solution back into a rows x cols 0/1 assignment matrix"""
+    return np.unpackbits(packed, axis=1, count=cols)
+
+
+# Problem data compiled once into (packed) arrays so the objectives are pure array math
+PREFERENCES = tas.iloc[:, 3:3 + cols].to_numpy()  # U (unwilling), W (willing), P (preferred) for each TA/section
+UNWILLING = pack(PREFERENCES == 'U')
+UNPREFERRED = pack(PREFERENCES == 'W')
+MAX_ASSIGNED = tas['max_assigned'].to_numpy()
+MIN_TA = sections['min_ta'].to_numpy()
+TIMESLOT_CODES, TIMESLOTS = pd.factorize(sections['daytime'])
+SECTION_TIMES = np.eye(len(TIMESLOTS), dtype=np.uint8)[TIMESLOT_CODES]  # section -> timeslot one-hot matrix
+VALID_BITS = pack(np.ones((1, cols), dtype=bool))  # the padding bits past the last section are always 0
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)  # number of 1 bits in each byte
+
+
+# Counts shared by the objectives and the fused evaluator, so each formula is written once
+def _overallocated(row_sums):
+    """Number of TAs assigned to more sections than their max, from each TA's number of assignments"""
+    return int((row_sums > MAX_ASSIGNED).sum())
+
+
+def _time_conflicted(bits):
+    """Number of TAs with more than one section in the same timeslot, from the unpacked assignments"""
+    return int(((bits @ SECTION_TIMES) > 1).any(axis=1).sum())  # count each TA's sections in every timeslot
+
+
+def _undersupported(col_sums):
+    """Number of sections with fewer TAs than their minimum, from each section's number of TAs"""
+    return int((MIN_TA > col_sums).sum())
+
+
+def _assigned_where(mask, array):
+    """Number of assignments that fall on the set bits of a packed mask"""
+    return int(POPCOUNT[mask & array].sum())
 
 
 # Objectives
 @profile
 def overallocation(array):
     """Sum the number of overallocation penalties for the TAs"""
-    return sum((array.sum(axis=1) - np.array(tas['max_assigned']) > 0)) # sum all rows (TAs) and get only those above max assigned
+    return _overallocated(POPCOUNT[array].sum(axis=1))  # count each row's (TA's) bits
 
 
 @profile
 def time_conflicts(array):
-    """Find the number of time conflicts"""
-    time_conflict = 0
-
-    for i in range(len(array)):
-        assigned_times = set()
-
-        # Iterate through each TA
-        for j in array[i]:
-            if array[i, j] == 1:
-                section_time = sections.loc[j, 'daytime']
-
-                # If a TA is already in that assigned time slot, add another time conflict and then go to the next TA
-                if section_time in assigned_times:
-                    time_conflict += 1
-                    break
-
-                else:
-                    assigned_times.add(section_time)
-
-    return time_conflict
+    """Find the number of TAs with a time conflict"""
+    return _time_conflicted(unpack(array))
 
 
 @profile
 def undersupport(array):
     """Sum number of undersupport penalties for the TAs"""
-    return sum((np.array(sections['min_ta']) - array.sum(axis=0)>0))  # Count how many TAs are under the minimum for each section
+    return _undersupported(unpack(array).sum(axis=0))  # number of TAs in each section
 
 
 @profile
 def unwilling(array):
     """Find the amount of times a TA was assigned to a section they were unwilling to be assigned to"""
-    # convert unpreferred, unwilling, and preffered for each section to an array
-    unwill_array = np.array(tas.iloc[:, 3:4 + cols])
-
-    # Set U's to 1 and else to 0
-    unwill_array = np.where(unwill_array == 'U', 1, 0)
-
-    # Find where TAs assigned to sections unwilling and then sum up amount
-    return np.sum(np.array(unwill_array & array))
+    return _assigned_where(UNWILLING, array)
 
 
 @profile
 def unpreferred(array):
     """Find amount of times TA was assigned to section they did not prefer to be assigned to"""
-    # convert unpreferred, unwilling, and preffered for each section to an array
-    unpref_array = np.array(tas.iloc[:, 3:4 + cols])
+    return _assigned_where(UNPREFERRED, array)
 
-    # Set W's to 1 and else to 0
-    unpref_array = np.where(unpref_array == 'W', 1, 0)
 
-    # Find where TAs assigned to sections unwilling and then sum up amount
-    return np.sum(np.array(unpref_array & array))
+@profile
+def evaluate(array):
+    """Compute all the objectives at once, unpacking the solution and taking its row and column sums only once"""
+    bits = unpack(array)
+    return {
+        'overallocation': _overallocated(bits.sum(axis=1)),
+        'time_conflicts': _time_conflicted(bits),
+        'undersupport': _undersupported(bits.sum(axis=0)),
+        'unpreferred': _assigned_where(UNPREFERRED, array),
+        'unwilling': _assigned_where(UNWILLING, array),
+    }
 
 
 # Agents
@@ -89,11 +122,8 @@ def toggle_random(solutions):
     rand_row = rnd.randint(0, rows-1)
     rand_col = rnd.randint(0, cols-1)
 
-    # toggle the number at that point
-    if array[rand_row, rand_col] == 0:
-        array[rand_row, rand_col] = 1
-    else:
-        array[rand_row, rand_col] = 0
+    # toggle the bit for that point, packbits puts the first column in the highest bit of each byte
+    array[rand_row, rand_col // 8] ^= 1 << (7 - rand_col % 8)
 
     return array
 
@@ -112,62 +142,72 @@ def swap_assignments(solutions):
     """Swap each assignment (0 -> 1 and 1 -> 0)"""
     array = solutions[0]
 
-    return (~array) + 2  # the ~ reverses bits (for integer is (-x) - 1, so add by 2 to swap 0s and 1s)
+    return ~array & VALID_BITS  # the ~ reverses every bit, the mask keeps the padding bits at 0
 
 
-def main():
-
+def make_environment():
+    """Create an environment with the TA objectives, agents and two random starting solutions"""
     # create the environment
-    E = Environment()
+    E = Environment(cache_size=CACHE_SIZE)  # packed solutions are compact enough to key the cache on directly
 
-    # register the fitness functions
+    # register the fitness functions, all evaluated together by one fused evaluator
     E.add_fitness_criteria("overallocation", overallocation)
     E.add_fitness_criteria("time_conflicts", time_conflicts)
     E.add_fitness_criteria("undersupport", undersupport)
     E.add_fitness_criteria("unpreferred", unpreferred)
     E.add_fitness_criteria("unwilling", unwilling)
+    E.set_evaluator(evaluate)
 
     # register the agents
     E.add_agent("toggle_random", toggle_random, k=1)
-    E.add_agent("get_and", get_and, k=2)
-    E.add_agent("swap_assignments", swap_assignments, k=1)
+    E.add_agent("get_and", get_and, k=2, mutates=False)  # these two build new arrays, so no copies needed
+    E.add_agent("swap_assignments", swap_assignments, k=1, mutates=False)
 
     # Adding 2 initial solutions
-    array1 = np.random.randint(low=0, high=2, size=(rows, cols))
+    array1 = pack(np.random.randint(low=0, high=2, size=(rows, cols)))
     E.add_solution(array1)
-    array2 = np.random.randint(low=0, high=2, size=(rows, cols))
+    array2 = pack(np.random.randint(low=0, high=2, size=(rows, cols)))
     E.add_solution(array2)
 
+    return E
+
+
+def main():
+
     # Run the evolver
-    E.evolve(1000000, 1000, 1000, time_max=600)
+    if ISLANDS > 1:
+        if RESUME:
+            raise ValueError('RESUME needs ISLANDS = 1, the islands start from make_environment and are only '
+                             'archived once they have all finished')
+        model = IslandModel(make_environment, islands=ISLANDS, migrate_every=1000)
+        E = model.evolve(1000000, time_max=600, adaptive=True)
+        model.report()
+        E.save_archive(ARCHIVE, rewrite=True)
+    else:
+        E = make_environment()
+        if RESUME and os.path.exists(ARCHIVE):  # pick up where the last run left off
+            print("Resumed", E.load_archive(ARCHIVE), "solutions from", ARCHIVE)
+        # compact a resumed archive down to the non-dominated solutions, or start a fresh one
+        E.save_archive(ARCHIVE, rewrite=True)
+        if WORKERS > 1:
+            E.evolve_parallel(1000000, workers=WORKERS, batch=250, dom=1000, status=1000, time_max=600,
+                              archive=ARCHIVE, archive_every=ARCHIVE_EVERY)
+        else:
+            E.evolve(1000000, status=1000, time_max=600, adaptive=True, archive=ARCHIVE, archive_every=ARCHIVE_EVERY)
 
     # Print final result
     print(E)
 
     # Report time
     Profiler.report()
+    E.cache_report()
 
-    # Initialize list of solution dictionaries and column headers
-    sols_list = list()
-    col_headers = list()
-
-    # Iterate through solutions
-    for i, eval in enumerate(E.pop.keys()):
-        # Turn solution into dictionary and add to list with the group name
-        sol_row = dict(eval)
-        sol_row['groupname'] = 'kensidfn'
-        sols_list.append(sol_row)
-
-        # First iteration add the keys to column header list
-        if i == 0:
-            col_headers = list(sol_row.keys())
-
+    # Write each solution's evaluation with the group name, one row at a time
     with open('solutions.csv', 'w', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=col_headers)
-
+        writer = csv.DictWriter(file, fieldnames=list(E.fitness) + ['groupname'])
         writer.writeheader()
-
-        writer.writerows(sols_list)
+        for eval in E.pop.keys():
+            writer.writerow({**dict(eval), 'groupname': 'kensidfn'})
 
 
 if __name__ == "__main__":
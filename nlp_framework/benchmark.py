@@ -0,0 +1,237 @@
+"""
+File: benchmark.py
+Description: Times each stage of TextAnalysis on synthesized corpora of several sizes
+"""
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import platform
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+import sankey as sk
+import text_analysis as ta
+from doc_term_matrix import DocumentTermMatrix
+
+SIZES = [100, 1000, 4000]  # number of documents in the corpora to benchmark
+DOC_LINES = 60  # lines in each synthesized document, about the length of a song
+SEED = 0  # Seed used to synthesize every corpus so results are comparable
+STOPWORDS = 'stopwords'
+SONGS = 'Songs/*'
+TOP_K = 10  # words in the sankey data
+PIPELINE = ['loading', 'tokenization', 'sentiment', 'aggregation', 'sankey']  # the stages, timed one at a time
+PHASES = PIPELINE + ['load_corpus']  # load_corpus repeats the loading stages end to end, so it's not in the total
+BASELINE = 'benchmark_baseline.json'  # stored report to compare against with --baseline
+
+
+def make_corpus(directory, documents, lines=DOC_LINES, seed=SEED):
+    """Write a corpus of documents made of lines drawn at random from the bundled songs, each line joining the
+    first half of one song line to the second half of another so lines rarely repeat (repeated lines would
+    only be scored for sentiment once)
+    :param directory: folder to write the documents to
+    :param documents: number of documents
+    :param lines: lines per document
+    :param seed: seed for picking the lines
+    :return paths: the documents' files
+    """
+    song_lines = []
+    for path in sorted(glob.glob(SONGS)):
+        with open(path, 'r') as file:
+            song_lines.extend(line.split() for line in file if line.strip())
+    firsts = [words[:len(words) // 2] for words in song_lines]
+    seconds = [words[len(words) // 2:] for words in song_lines]
+
+    rng = random.Random(seed)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(directory, f'doc{i:06d}.txt')
+        with open(path, 'w') as file:
+            for first, second in zip(rng.choices(firsts, k=lines), rng.choices(seconds, k=lines)):
+                file.write(' '.join(first + second) + '\n')
+        paths.append(path)
+    return paths
+
+
+def loading(paths):
+    """Read every document from disk"""
+    size = 0
+    for path in paths:
+        with open(path, 'r') as file:
+            size += len(file.read())
+    return size, 'chars'
+
+
+def tokenization(paths):
+    """Tokenize every document and count its words, the default parser without the sentiment"""
+    stopwords = ta.TextAnalysis._load_stop_words(STOPWORDS)
+    words = 0
+    wordcounts = {}
+    for path in paths:
+        wordcount = Counter()
+        with open(path, 'r') as file:
+            for tokens, _ in ta.TextAnalysis._read_words(file):
+                wordcount.update(word for word in tokens if word not in stopwords)
+        wordcounts[path] = wordcount
+        words += sum(wordcount.values())
+    return words, 'words', wordcounts
+
+
+def sentiment(paths):
+    """Score every line of every document, as the default parser does with sentiment='sentence'"""
+    ta._sentence_scores.cache_clear()  # repeated lines would otherwise only be scored once over all runs
+    sentences = 0
+    for path in paths:
+        scores = ta._SentenceScores()
+        with open(path, 'r') as file:
+            for line in file:
+                scores.add([line.strip()])
+        sentences += scores.results()[1]['sentences']
+    return sentences, 'sentences'
+
+
+def aggregation(wordcounts):
+    """Sum the word counts of the corpus, both with Counters and into a document-term matrix"""
+    totals = Counter()
+    for wordcount in wordcounts.values():
+        totals.update(wordcount)
+    dtm = DocumentTermMatrix()
+    for label, wordcount in wordcounts.items():
+        dtm.add(label, wordcount)
+    dtm.top_k(TOP_K)
+    return len(wordcounts), 'docs'
+
+
+def sankey(wordcounts):
+    """Build the sankey links of the most common words and code their nodes"""
+    analysis = ta.TextAnalysis()
+    analysis.data['wordcount'] = wordcounts
+    links = analysis.wordcount_links(k=TOP_K)
+    sk._code_mapping(links, 'label', 'word')
+    return len(links), 'links'
+
+
+def load_corpus(paths):
+    """Load the corpus end to end the way the framework does, with TextAnalysis.load_corpus in this process
+    (no parse cache), sentence sentiment and the document-term matrix and n-gram index filled in as it loads"""
+    ta._sentence_scores.cache_clear()
+    analysis = ta.TextAnalysis(doc_term=True, ngrams=True)
+    analysis.load_corpus(paths, STOPWORDS, workers=1, keep_text=False, sentiment='sentence')
+    return len(paths), 'docs'
+
+
+def measure(phase, trace_memory, *args):
+    """Time one phase, then run it again under tracemalloc for its peak memory if trace_memory"""
+    start = time.perf_counter_ns()
+    out = phase(*args)
+    sec = (time.perf_counter_ns() - start) / 10**9
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        phase(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return sec, peak, out
+
+
+def run_size(documents, trace_memory=False):
+    """Synthesize a corpus and time every phase on it
+    :param documents: number of documents
+    :param trace_memory: also measure each phase's peak Python memory (runs every phase twice)
+    :return result: dictionary of the phase timings, throughputs and peak memory
+    """
+    ta._sentiment_analyzer()  # load the VADER lexicon up front so the first phase doesn't pay for it
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_corpus(directory, documents)
+        measured = {
+            'loading': measure(loading, trace_memory, paths),
+            'tokenization': measure(tokenization, trace_memory, paths),
+            'sentiment': measure(sentiment, trace_memory, paths),
+        }
+        wordcounts = measured['tokenization'][2][2]  # the later phases work on the tokenized corpus
+        measured['aggregation'] = measure(aggregation, trace_memory, wordcounts)
+        measured['sankey'] = measure(sankey, trace_memory, wordcounts)
+        measured['load_corpus'] = measure(load_corpus, trace_memory, paths)
+
+    phase_sec = {name: sec for name, (sec, _, _) in measured.items()}
+    phase_peak = {name: peak for name, (_, peak, _) in measured.items()}
+    throughput = {name: {'items': out[0], 'unit': out[1], 'per_sec': out[0] / sec if sec > 0 else None}
+                  for name, (sec, _, out) in measured.items()}
+
+    return {
+        'documents': documents,
+        'phase_sec': phase_sec,
+        'throughput': throughput,
+        'phase_peak_bytes': phase_peak,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,  # of this size's own process, see main
+        'total_sec': sum(phase_sec[name] for name in PIPELINE),
+    }
+
+
+def _mb(size_bytes):
+    """Format a memory size in MB, '-' when it wasn't measured"""
+    return f'{size_bytes / 2**20:9.1f}' if size_bytes is not None else f"{'-':>9s}"
+
+
+def compare(results, baseline):
+    """Print the speedup and the peak memory of each run against the matching run in a baseline report
+    The memory of a phase is its tracemalloc peak (only with --trace_memory), the total's is the max RSS.
+    The total is summed over the PIPELINE phases both reports have, so it is comparable to older reports"""
+    base_runs = {r['documents']: r for r in baseline['results']}
+
+    print("Documents  Phase              Base(s)    New(s)  Speedup  BaseMB     NewMB")
+    for result in results:
+        base = base_runs.get(result['documents'])
+        if base is None:
+            continue
+        shared = [phase for phase in PHASES if phase in base['phase_sec']]  # phases added since are skipped
+        base_peak = base.get('phase_peak_bytes', {})
+        for phase in shared + ['total']:
+            if phase == 'total':
+                old = sum(base['phase_sec'][name] for name in PIPELINE if name in shared)
+                new = sum(result['phase_sec'][name] for name in PIPELINE if name in shared)
+                old_mem, new_mem = base['max_rss_kb'] * 1024, result['max_rss_kb'] * 1024
+            else:
+                old, new = base['phase_sec'][phase], result['phase_sec'][phase]
+                old_mem, new_mem = base_peak.get(phase), result['phase_peak_bytes'][phase]
+            speedup = old / new if new > 0 else float('inf')
+            print(f"{result['documents']:9d}  {phase:15s} {old:10.4f} {new:10.4f} {speedup:8.2f}x "
+                  f"{_mb(old_mem)} {_mb(new_mem)}")
+
+
+def main():
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the text analysis framework.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Corpus sizes (documents) to benchmark')
+    parser.add_argument('--trace_memory', action='store_true',
+                        help='Measure the peak memory of every phase (runs each phase a second time)')
+    parser.add_argument('--output', default='benchmark.json', help='File to write the JSON report to')
+    parser.add_argument('--baseline', default=None, help=f'Earlier JSON report to compare against, e.g. {BASELINE}')
+    args = parser.parse_args()
+
+    results = []
+    for documents in args.sizes:
+        # each size runs in a fresh process, so its max RSS isn't the peak left behind by an earlier size
+        with mp.get_context('spawn').Pool(1) as pool:
+            result = pool.apply(run_size, (documents, args.trace_memory))
+        rates = '  '.join(f"{name}: {t['per_sec']:,.0f} {t['unit']}/s"
+                          for name, t in result['throughput'].items() if t['per_sec'] is not None)
+        print(f"{documents:9d}  {result['total_sec']:10.4f}s  {rates}  max RSS: {result['max_rss_kb'] // 1024} MB")
+        results.append(result)
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'seed': SEED,
+              'doc_lines': DOC_LINES, 'results': results}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
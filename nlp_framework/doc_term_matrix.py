@@ -0,0 +1,147 @@
+"""
+File: doc_term_matrix.py
+Description: A sparse document-term matrix in CSR form, built one document at a time
+"""
+import numpy as np
+
+
+class DocumentTermMatrix:
+    """Word counts of every document as a compressed sparse row matrix: row i holds the counts of document i
+    in counts[indptr[i]:indptr[i + 1]] for the word ids in indices[indptr[i]:indptr[i + 1]].
+    Word ids come from one vocabulary shared by every document, and the corpus total of every word
+    is kept up to date as documents are added, so nothing dense is ever built per document"""
+
+    def __init__(self):
+        """Constructor"""
+        self.vocab = {}  # word -> word id
+        self.words = []  # word id -> word
+        self.rows = {}  # document label -> row
+        self.labels = []  # row -> document label, None for a row replaced by a newer version of the document
+        self.positions = []  # row -> position of its document in the order the documents were first added
+        self.indptr = [0]  # row i is stored in positions indptr[i] up to indptr[i + 1]
+        self._indices = []  # word ids of each row, joined into one array when needed
+        self._counts = []  # counts of each row
+        self._totals = np.zeros(1024, dtype=np.int64)  # word id -> count across the corpus (extra entries are spare)
+
+    def add(self, label, wordcount):
+        """Add a document's word counts as a new row, replacing an earlier document with the same label
+        :param label: label of the document
+        :param wordcount: dictionary (or Counter) of word -> count
+        """
+        position = len(self.rows)
+        if label in self.rows:  # the new row takes over the old one's position
+            row = self.rows[label]
+            ids, counts = self._row(row)
+            self._totals[ids] -= counts
+            self.labels[row] = None
+            position = self.positions[row]
+
+        vocab = self.vocab
+        words = self.words
+        ids = np.empty(len(wordcount), dtype=np.int32)
+        for i, word in enumerate(wordcount):
+            word_id = vocab.get(word)
+            if word_id is None:
+                word_id = vocab[word] = len(words)
+                words.append(word)
+            ids[i] = word_id
+        counts = np.fromiter(wordcount.values(), dtype=np.int64, count=len(wordcount))
+        order = np.argsort(ids)  # CSR rows keep their word ids sorted
+
+        if len(words) > len(self._totals):  # grow the totals by doubling
+            self._totals = np.concatenate([self._totals, np.zeros(max(len(words), len(self._totals)), dtype=np.int64)])
+        self._totals[ids] += counts
+
+        self.rows[label] = len(self.labels)
+        self.labels.append(label)
+        self.positions.append(position)
+        self._indices.append(ids[order])
+        self._counts.append(counts[order])
+        self.indptr.append(self.indptr[-1] + len(ids))
+
+    def _row(self, row):
+        """Word ids and counts of a row"""
+        self._join()
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self._indices[0][start:end], self._counts[0][start:end]
+
+    def _join(self):
+        """Join the rows added since the last call into single index and count arrays"""
+        if len(self._indices) != 1:
+            self._indices = [np.concatenate(self._indices) if self._indices else np.zeros(0, dtype=np.int32)]
+            self._counts = [np.concatenate(self._counts) if self._counts else np.zeros(0, dtype=np.int64)]
+
+    def totals(self):
+        """Count of every word across the corpus, indexed by word id"""
+        return self._totals[:len(self.words)]
+
+    def top_k(self, k=5, label=None):
+        """The k most common words and their counts, in the whole corpus or in one document
+        :param k: number of words
+        :param label: document to look in, None for the whole corpus
+        :return: list of (word, count), most common first
+        """
+        if label is None:
+            ids = np.arange(len(self.words))
+            counts = self.totals()
+        else:
+            ids, counts = self._row(self.rows[label])
+        present = counts > 0  # words of replaced documents stay in the vocabulary with a total of 0
+        ids, counts = ids[present], counts[present]
+        if k < len(counts):
+            best = np.argpartition(-counts, k - 1)[:k]  # the k largest without sorting everything
+        else:
+            best = np.arange(len(counts))
+        best = best[np.lexsort((ids[best], -counts[best]))]  # most common first, ties by word id
+        return [(self.words[ids[i]], int(counts[i])) for i in best]
+
+    def vector(self, label):
+        """Word counts of one document as a dictionary of word -> count"""
+        ids, counts = self._row(self.rows[label])
+        return {self.words[i]: int(c) for i, c in zip(ids, counts)}
+
+    def counts_of(self, words):
+        """Counts of some words in every document
+        :param words: list of words
+        :return: (document labels, word of each count, count) arrays, only for the non-zero counts
+        """
+        self._join()
+        wanted = np.full(len(self.words), -1)
+        for i, word in enumerate(words):
+            if word in self.vocab:
+                wanted[self.vocab[word]] = i
+
+        indices, counts = self._indices[0], self._counts[0]
+        rows = np.repeat(np.arange(len(self.labels)), np.diff(self.indptr))
+        live = np.array([label is not None for label in self.labels], dtype=bool)
+        keep = (wanted[indices] >= 0) & live[rows]
+
+        word_order = wanted[indices[keep]]
+        rows, counts = rows[keep], counts[keep]
+        order = np.lexsort((np.array(self.positions)[rows], word_order))  # by word in the order given, then document
+        labels = np.empty(len(self.labels), dtype=object)  # filled in so tuple labels stay single objects
+        labels[:] = self.labels
+        words = np.array(words, dtype=object)
+        return labels[rows[order]], words[word_order[order]], counts[order]
+
+    def to_csr(self):
+        """The matrix as a scipy.sparse.csr_matrix (needs scipy) with one row per current document,
+        in the order of document_labels()"""
+        from scipy.sparse import csr_matrix
+        self._join()
+        matrix = csr_matrix((self._counts[0], self._indices[0], np.array(self.indptr)),
+                            shape=(len(self.labels), len(self.words)))
+        return matrix[self._live_rows()]
+
+    def _live_rows(self):
+        """Rows of the current documents, in the order the documents were first added"""
+        return sorted((row for row, label in enumerate(self.labels) if label is not None),
+                      key=lambda row: self.positions[row])
+
+    def document_labels(self):
+        """Labels of the current documents, in the order they were first added (a replaced document keeps its place)"""
+        return [self.labels[row] for row in self._live_rows()]
+
+    def __len__(self):
+        """Number of documents"""
+        return len(self.rows)
@@ -0,0 +1,214 @@
+"""
+File: ngram_index.py
+Description: Corpus wide n-gram and word co-occurrence counts, built incrementally as documents load
+"""
+import numpy as np
+
+NGRAM_SIZES = (2, 3)  # n-grams counted by default, bigrams and trigrams
+WINDOW = 5  # words that co-occur with a word are the ones up to this many positions after it
+WORD_BITS = 21  # bits per word id when an n-gram is packed into one int64 id, so trigrams fit
+MAX_WORDS = 1 << WORD_BITS
+
+
+def _pack(ids):
+    """Pack each row of an (n-grams x n) array of word ids into a single int64 id"""
+    packed = np.zeros(len(ids), dtype=np.int64)
+    for col in range(ids.shape[1]):
+        packed = (packed << WORD_BITS) | ids[:, col]
+    return packed
+
+
+def _unpack(packed, n):
+    """Unpack int64 ids back into an (n-grams x n) array of word ids"""
+    ids = np.empty((len(packed), n), dtype=np.int64)
+    for col in range(n - 1, -1, -1):
+        ids[:, col] = packed & (MAX_WORDS - 1)
+        packed = packed >> WORD_BITS
+    return ids
+
+
+def _check_sizes(sizes):
+    """The n-gram sizes as a tuple, making sure n words of WORD_BITS bits each fit in one int64 id"""
+    sizes = tuple(sizes)
+    if not sizes or min(sizes) < 1 or max(sizes) * WORD_BITS > 63:
+        raise ValueError(f'n-gram sizes have to be between 1 and {63 // WORD_BITS}, got {sizes}')
+    return sizes
+
+
+def _count(ids, counts=None):
+    """Add up the counts of equal ids
+    :return: sorted unique ids and their counts
+    """
+    unique, inverse = np.unique(ids, return_inverse=True)
+    return unique, np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
+
+
+def _merge(parts):
+    """Merge a list of (ids, counts) pairs into one"""
+    if not parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return _count(np.concatenate([ids for ids, _ in parts]), np.concatenate([counts for _, counts in parts]))
+
+
+class DocumentNgrams:
+    """Counts the n-grams and co-occurring word pairs of one document as its words stream in, using word ids
+    local to the document (NgramIndex maps them to the corpus vocabulary)"""
+
+    def __init__(self, sizes=NGRAM_SIZES, window=WINDOW):
+        """Constructor
+        :param sizes: the n of every n-gram size to count
+        :param window: co-occurrence window, 0 to not count co-occurrences
+        """
+        self.sizes = _check_sizes(sizes)
+        self.window = window
+        self.vocab = {}  # word -> id local to this document
+        self.tail = np.zeros(0, dtype=np.int64)  # last words of the previous chunk, n-grams can span chunks
+        self.parts = {key: [] for key in self.sizes + ('cooccurrence',)}  # key -> list of (ids, counts)
+
+    def add(self, words):
+        """Count the n-grams and pairs that end in the next chunk of words"""
+        vocab = self.vocab
+        new = np.fromiter((vocab.setdefault(word, len(vocab)) for word in words), dtype=np.int64, count=len(words))
+        if len(vocab) > MAX_WORDS:
+            raise ValueError(f'n-gram ids only have room for {MAX_WORDS} distinct words')
+        tokens = np.concatenate([self.tail, new])
+        start = len(self.tail)  # position of the first new word
+
+        for n in self.sizes:
+            grams = np.lib.stride_tricks.sliding_window_view(tokens, n)[max(start - n + 1, 0):] \
+                if len(tokens) >= n else np.zeros((0, n), dtype=np.int64)
+            self._add_part(n, _pack(grams))
+
+        pairs = []
+        for distance in range(1, min(self.window, len(tokens) - 1) + 1):
+            first = max(start - distance, 0)
+            pair = np.stack([tokens[first:len(tokens) - distance], tokens[first + distance:]], axis=1)
+            pairs.append(pair[pair[:, 0] != pair[:, 1]])  # a word next to itself isn't a co-occurrence
+        if pairs:
+            pairs = np.sort(np.concatenate(pairs), axis=1)  # pairs are unordered, smaller id first
+            self._add_part('cooccurrence', _pack(pairs))
+
+        keep = max(max(self.sizes, default=1) - 1, self.window)
+        self.tail = tokens[max(len(tokens) - keep, 0):]
+
+    def _add_part(self, key, ids):
+        """Count a chunk's ids, merging the chunks counted so far now and then to keep the list short"""
+        parts = self.parts[key]
+        parts.append(_count(ids))
+        if len(parts) >= 16:
+            self.parts[key] = [_merge(parts)]
+
+    def results(self):
+        """The document's words (local id -> word) and its counts, key -> (sorted packed ids, counts)"""
+        return {'words': list(self.vocab), 'counts': {key: _merge(parts) for key, parts in self.parts.items()}}
+
+
+class NgramIndex:
+    """N-gram and co-occurrence counts of a whole corpus. Each n-gram is one int64 id (the word ids of the
+    shared vocabulary packed together), counts are kept as sorted id and count arrays, and the documents
+    added since the last merge wait in a list until there are about as many of them as merged entries"""
+
+    def __init__(self, sizes=NGRAM_SIZES, window=WINDOW, max_size=None, min_count=2):
+        """Constructor
+        :param sizes: the n of every n-gram size to count
+        :param window: co-occurrence window, 0 to not count co-occurrences
+        :param max_size: when a table has more entries than this after a merge, its entries with counts
+        below min_count are thrown out, None never prunes
+        :param min_count: smallest count kept by pruning
+        """
+        self.sizes = _check_sizes(sizes)
+        self.window = window
+        self.max_size = max_size
+        self.min_count = min_count
+        self.vocab = {}  # word -> id
+        self.words = []  # id -> word
+        self.tables = {key: (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+                       for key in self.sizes + ('cooccurrence',)}
+        self.pending = {key: [] for key in self.tables}  # per key, (ids, counts) of documents not merged yet
+        self.pending_size = dict.fromkeys(self.tables, 0)
+
+    def add(self, document):
+        """Add the counts of a document (DocumentNgrams.results) to the corpus counts"""
+        local = np.empty(len(document['words']), dtype=np.int64)  # local word id -> corpus word id
+        for i, word in enumerate(document['words']):
+            word_id = self.vocab.get(word)
+            if word_id is None:
+                word_id = self.vocab[word] = len(self.words)
+                self.words.append(word)
+            local[i] = word_id
+        if len(self.words) > MAX_WORDS:
+            raise ValueError(f'n-gram ids only have room for {MAX_WORDS} distinct words')
+
+        for key, (ids, counts) in document['counts'].items():
+            if key not in self.tables or len(ids) == 0:
+                continue
+            grams = local[_unpack(ids, self._n(key))]
+            if key == 'cooccurrence':
+                grams.sort(axis=1)  # smaller id first again, now with the corpus ids
+            self.pending[key].append((_pack(grams), counts))
+            self.pending_size[key] += len(ids)
+            if self.pending_size[key] >= max(len(self.tables[key][0]), 1 << 16):
+                self._merge(key)
+
+    @staticmethod
+    def _n(key):
+        """Number of words in the ids of a table"""
+        return 2 if key == 'cooccurrence' else key
+
+    def _merge(self, key):
+        """Merge a table's pending documents into it, pruning it if it has grown past max_size"""
+        if self.pending[key]:
+            ids, counts = _merge([self.tables[key]] + self.pending[key])
+            self.pending[key] = []
+            self.pending_size[key] = 0
+            if self.max_size is not None and len(ids) > self.max_size:
+                keep = counts >= self.min_count
+                ids, counts = ids[keep], counts[keep]
+            self.tables[key] = (ids, counts)
+        return self.tables[key]
+
+    def prune(self, min_count):
+        """Throw out every n-gram and pair counted fewer than min_count times"""
+        for key in self.tables:
+            ids, counts = self._merge(key)
+            keep = counts >= min_count
+            self.tables[key] = (ids[keep], counts[keep])
+
+    def top_k(self, k=10, n=2):
+        """The k most common n-grams (n='cooccurrence' for co-occurring pairs)
+        :return: list of (tuple of words, count), most common first
+        """
+        ids, counts = self._merge(n)
+        if k < len(counts):
+            best = np.argpartition(-counts, k - 1)[:k]  # the k largest without sorting everything
+        else:
+            best = np.arange(len(counts))
+        best = best[np.lexsort((ids[best], -counts[best]))]  # most common first, ties by id
+        grams = _unpack(ids[best], self._n(n))
+        return [(tuple(self.words[i] for i in gram), int(counts[j])) for gram, j in zip(grams, best)]
+
+    def count(self, *words):
+        """How often a sequence of words appears in the corpus"""
+        if len(words) not in self.sizes:
+            raise ValueError(f'{len(words)}-grams are not counted, only {self.sizes}')
+        if any(word not in self.vocab for word in words):
+            return 0
+        ids, counts = self._merge(len(words))
+        packed = _pack(np.array([[self.vocab[word] for word in words]]))[0]
+        i = np.searchsorted(ids, packed)
+        return int(counts[i]) if i < len(ids) and ids[i] == packed else 0
+
+    def cooccurring(self, word, k=10):
+        """The k words that most often appear within the window of a word
+        :return: list of (word, count), most common first
+        """
+        if word not in self.vocab:
+            return []
+        ids, counts = self._merge('cooccurrence')
+        pairs = _unpack(ids, 2)
+        word_id = self.vocab[word]
+        has_word = (pairs[:, 0] == word_id) | (pairs[:, 1] == word_id)
+        others = pairs[has_word].sum(axis=1) - word_id  # the other word of each pair
+        counts = counts[has_word]
+        best = np.lexsort((others, -counts))[:k]
+        return [(self.words[others[i]], int(counts[i])) for i in best]
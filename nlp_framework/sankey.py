@@ -3,25 +3,20 @@ File: sankey.py
 Description: Provide a wrapper that maps a dataframe to a sankey diagram
 """
 
+import pandas as pd
 import plotly.graph_objects as go
 
 
 def _code_mapping(df, src, targ):
     """Map labels in src and targ to integers"""
 
-    # get distinct labels
-    labels = sorted(set(list(df[src])+list(df[targ])))
-
-    # get integer codes
-    codes = list(range(len(labels)))
-
-    # create label to code mapping
-    lc_map = dict(zip(labels, codes))
+    # integer codes of the distinct labels in both columns at once, numbered in sorted label order
+    codes, labels = pd.factorize(pd.concat([df[src], df[targ]], ignore_index=True), sort=True)
 
     # substitute names for codes in the dataframe
-    df = df.replace({src: lc_map, targ: lc_map})
+    df = df.assign(**{src: codes[:len(df)], targ: codes[len(df):]})
 
-    return df, labels
+    return df, list(labels)
 
 
 def make_sankey(df, src, targ, vals=None, **kwargs):
@@ -4,18 +4,17 @@ Description: Uses the TextAnalysis class to look at the 7 songs of To Pimp a But
 """
 from text_analysis import TextAnalysis
 import pprint as pp
+from glob import glob
+import os
 
 
 def main():
-    tt = TextAnalysis()
-    stopwords = 'stopwords'
-    tt.load_text('Songs/Alright Lyrics', stopwords, 'Alright')
-    tt.load_text('Songs/Blacker the Berry Lyrics', stopwords, 'Blacker the Berry')
-    tt.load_text('Songs/How Much a Dollar Cost Lyrics', stopwords, 'How Much a Dollar Cost')
-    tt.load_text('Songs/i Lyrics', stopwords, 'i')
-    tt.load_text('Songs/King Kunta Lyrics', stopwords, 'King Kunta')
-    tt.load_text('Songs/u Lyrics', stopwords, 'u')
-    tt.load_text("Songs/You Ain't Gotta Lie Lyrics", stopwords, "You Ain't Gotta Lie")
+    tt = TextAnalysis(cache_dir='.parse_cache')  # songs that haven't changed since the last run aren't parsed again
+    songs = sorted(glob('Songs/*'), key=str.lower)  # ignoring case keeps 'i' and 'u' in the album's alphabetical order
+    stats = tt.load_corpus(songs, 'stopwords', labels=lambda path: os.path.basename(path).removesuffix(' Lyrics'),
+                           sentiment='sentence')  # lyrics are scored line by line
+    print(f"Loaded {stats['documents']} songs in {stats['seconds']:.2f}s ({stats['docs_per_sec']:.1f} docs/sec, "
+          f"{stats['sentences_per_sec']:.0f} lines/sec, {stats['cache_hits']} from the cache)")
 
     pp.pprint(tt.data)
 
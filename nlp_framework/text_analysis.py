@@ -5,108 +5,454 @@ Description: A reusable library for text analysis and comparison
 import matplotlib.pyplot as plt
 from collections import Counter, defaultdict
 import sankey as sk
+from doc_term_matrix import DocumentTermMatrix
+from ngram_index import DocumentNgrams, NgramIndex
+import numpy as np
 import pandas as pd
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
 import seaborn as sns
 from wordcloud import WordCloud
+from PIL import Image, ImageDraw
+import functools
+import glob
+import hashlib
+import multiprocessing as mp
+import os
+import pickle
+import re
+import sys
+import time
+
+CHUNK_SIZE = 1 << 20  # characters read from a text file at a time
+CACHE_VERSION = 1  # part of every parse cache key, bump it when the default parser's results change
+NOT_WORD = re.compile(r'[^\w\s]|_')  # removed by the default parser, anything that isn't a letter, digit or whitespace
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\s*\n\s*')  # sentences end at . ! or ? followed by a space, or a line break
+SENTENCE_BATCH = 1000  # sentences scored together before they are added to a document's statistics
+SENTENCE_CACHE = 100000  # sentence scores remembered per process, repeated lines like a chorus are scored once
+TITLE_HEIGHT = 20  # pixels above each word cloud on a contact sheet for its label
+
+
+@functools.lru_cache(maxsize=None)
+def _not_digit_table():
+    """Translate table deleting the numeric characters like ½ that \\w matches but aren't digits
+    (built on first use, it takes a scan of every unicode character)"""
+    return dict.fromkeys(c for c in range(sys.maxunicode + 1)
+                         if chr(c).isalnum() and not (chr(c).isalpha() or chr(c).isdigit()))
+
+
+def _parse(task):
+    """Parse one document, looking it up in the parse cache first if there is one
+    :param task: (file name, stop words file, parser or None for the default parser, dictionary of
+    default parser options, parse cache directory or None)
+    :return: the parser's results and whether they came from the cache
+    """
+    filename, stopwords_file, parser, options, cache_dir = task
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, _cache_key(filename, stopwords_file, parser, options) + '.pkl')
+        try:
+            with open(path, 'rb') as file:
+                return pickle.load(file), True
+        except Exception:
+            pass  # not cached yet, or an entry that no longer loads (broken, or pickled by other library versions)
+
+    if parser is None:
+        results = TextAnalysis._default_parser(filename, stopwords_file, **options)
+    else:
+        results = parser(filename)
+
+    if cache_dir is not None:
+        # write to a temporary file and then rename it, so other processes never read half an entry
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as file:
+            pickle.dump(results, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    return results, False
+
+
+_file_hashes = {}  # file -> (modification time, size, hash), so unchanged files like the stop words are hashed once
+
+
+def _file_hash(filename):
+    """SHA-256 of a file's contents, read in binary chunks"""
+    stat = os.stat(filename)
+    cached = _file_hashes.get(filename)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    _file_hashes[filename] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+    return _file_hashes[filename][2]
+
+
+def _code_digest(code, digest):
+    """Add a compiled function's bytecode, constants and names (and those of any functions nested in it) to a hash"""
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            _code_digest(const, digest)
+        else:
+            digest.update(repr(const).encode())
+
+
+def _parser_id(parser):
+    """Identify a custom parser by its name and its code, so two lambdas don't share cache entries and editing
+    a parser's body doesn't keep serving its old results. Variables a parser closes over are part of it too,
+    so one whose values have no stable repr just misses the cache rather than ever returning stale results"""
+    code = getattr(parser, '__code__', None)
+    if code is None:  # some other callable, like a functools.partial
+        return repr(parser)
+    digest = hashlib.sha256()
+    _code_digest(code, digest)
+    for cell in parser.__closure__ or ():
+        digest.update(repr(cell.cell_contents).encode())
+    return f'{parser.__module__}.{parser.__qualname__}|{digest.hexdigest()}'
+
+
+def _cache_key(filename, stopwords_file, parser, options):
+    """Parse cache key from the file's contents, the stop words' contents and which parser is used"""
+    parser_id = 'default' if parser is None else _parser_id(parser)
+    stop_hash = _file_hash(stopwords_file) if stopwords_file is not None else ''
+    key = f'{CACHE_VERSION}|{_file_hash(filename)}|{stop_hash}|{parser_id}|{sorted(options.items())}'
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+# Resources loaded once per process and reused for every document
+_stop_words = {}  # stop words file -> (modification time, frozenset of the words)
+_analyzer = None  # VADER sentiment analyzer, created on first use
+
+
+def _sentiment_analyzer():
+    """Get the sentiment analyzer, creating it the first time
+    nltk is only imported here and the VADER lexicon only downloaded if it isn't installed yet"""
+    global _analyzer
+    if _analyzer is None:
+        import nltk
+        from nltk.sentiment import SentimentIntensityAnalyzer
+        try:
+            _analyzer = SentimentIntensityAnalyzer()
+        except LookupError:
+            nltk.download('vader_lexicon', quiet=True)
+            _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+
+@functools.lru_cache(maxsize=SENTENCE_CACHE)
+def _sentence_scores(sentence):
+    """VADER scores of one sentence as (neg, neu, pos, compound)"""
+    score = _sentiment_analyzer().polarity_scores(sentence)
+    return score['neg'], score['neu'], score['pos'], score['compound']
+
+
+def _render_cloud(task):
+    """Render one word cloud with PIL (no matplotlib), in a worker process
+    :param task: (label, dictionary of word -> count, file to write or None, width, height)
+    :return: the file written, or the image as a height x width x 3 array if there is no file
+    """
+    label, frequencies, path, width, height = task
+    if frequencies:
+        image = WordCloud(width=width, height=height, background_color='white', max_words=len(frequencies)) \
+            .generate_from_frequencies(frequencies).to_image()
+    else:  # nothing to draw, a blank cloud
+        image = Image.new('RGB', (width, height), 'white')
+    if path is None:
+        return np.asarray(image)
+    image.save(path)
+    return path
+
+
+class _SentenceScores:
+    """Scores sentences in batches and keeps running statistics of their sentiment, so a document's
+    sentences never have to be held in memory all at once"""
+
+    KEYS = ['neg', 'neu', 'pos', 'compound']
+    BINS = np.linspace(-1, 1, 11)  # edges of the compound score histogram
+
+    def __init__(self):
+        self.batch = []
+        self.n = 0
+        self.sums = np.zeros(len(_SentenceScores.KEYS))
+        self.compound_sq = 0.0  # sum of squared compound scores for the standard deviation
+        self.hist = np.zeros(len(_SentenceScores.BINS) - 1, dtype=np.int64)
+        self.negative = 0  # sentences with a compound score of -0.05 or less
+        self.positive = 0  # sentences with a compound score of 0.05 or more
+        self.most_negative = (np.inf, None)  # (compound score, sentence)
+        self.most_positive = (-np.inf, None)
+
+    def add(self, sentences):
+        """Queue sentences for scoring, scoring a batch whenever SENTENCE_BATCH have been queued"""
+        self.batch.extend(sentence for sentence in sentences if sentence and not sentence.isspace())
+        if len(self.batch) >= SENTENCE_BATCH:
+            self.flush()
+
+    def flush(self):
+        """Score the queued sentences and add them to the statistics"""
+        if not self.batch:
+            return
+        scores = np.array(list(map(_sentence_scores, self.batch)))
+        compound = scores[:, 3]
+        self.n += len(scores)
+        self.sums += scores.sum(axis=0)
+        self.compound_sq += float(compound @ compound)
+        self.hist += np.histogram(compound, _SentenceScores.BINS)[0]
+        self.negative += int(np.count_nonzero(compound <= -0.05))  # VADER's usual thresholds
+        self.positive += int(np.count_nonzero(compound >= 0.05))
+        low, high = compound.argmin(), compound.argmax()
+        if compound[low] < self.most_negative[0]:
+            self.most_negative = (float(compound[low]), self.batch[low])
+        if compound[high] > self.most_positive[0]:
+            self.most_positive = (float(compound[high]), self.batch[high])
+        self.batch = []
+
+    def results(self):
+        """Mean scores (the same keys as a whole document score) and the statistics of the sentences"""
+        self.flush()
+        means = self.sums / self.n if self.n else self.sums
+        mean_compound = means[3]
+        stats = {
+            'sentences': self.n,
+            'compound_std': float(np.sqrt(max(self.compound_sq / self.n - mean_compound ** 2, 0))) if self.n else 0.0,
+            'compound_hist': self.hist.tolist(),
+            'negative': self.negative,
+            'neutral': self.n - self.negative - self.positive,
+            'positive': self.positive,
+            'most_negative': self.most_negative if self.n else (0.0, None),
+            'most_positive': self.most_positive if self.n else (0.0, None),
+        }
+        return {key: round(float(mean), 4) for key, mean in zip(_SentenceScores.KEYS, means)}, stats
 
-nltk.download('vader_lexicon')
 
 class TextAnalysis:
-    def __init__(self):
-        """Constructor"""
+    def __init__(self, doc_term=False, cache_dir=None, ngrams=False):
+        """Constructor
+        :param doc_term: also keep the word counts in a sparse document-term matrix (self.dtm) as documents
+        load, which the word count methods then use instead of building dense tables
+        :param cache_dir: directory of parsed documents keyed by the hash of the file, the stop words and the
+        parser, so unchanged documents are not parsed (or scored for sentiment) again. None turns it off
+        :param ngrams: also count bigrams, trigrams and co-occurring words in self.ngrams (an NgramIndex, which can
+        be replaced with one using other sizes, window or pruning) as documents load"""
         self.data = defaultdict(dict)
+        self.dtm = DocumentTermMatrix() if doc_term else None
+        self.ngrams = NgramIndex() if ngrams else None
+        self.cache_dir = cache_dir
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     @staticmethod
-    def _default_parser(filename, stopwords_file):
+    def _default_parser(filename, stopwords_file, keep_text=True, sentiment='document', ngrams=None):
         """this should probably be a default text parser for processing simple
-        unformatted text files."""
+        unformatted text files.
+        The file is read and counted CHUNK_SIZE characters at a time, but memory only stays bounded for very
+        large files with keep_text=False (no 'cleaned text') and sentiment='sentence', since the defaults keep
+        the cleaned words and the raw text of the whole file for the 'cleaned text' and the document score.
+        sentiment='sentence' scores every sentence (or line) separately as the file is read, the 'sentiment'
+        is then the mean sentence scores, with their distribution and extremes in 'sentence sentiment'.
+        'document' scores the whole text at once.
+        ngrams=(sizes, window) also counts the document's n-grams and co-occurring words (after removing
+        the stop words) into 'ngrams'."""
 
         # Get the stop words
         stopwords = TextAnalysis._load_stop_words(stopwords_file)
 
+        wordcount = Counter()
+        kept = []  # cleaned words of each chunk, only if keep_text
+        raw = []  # raw chunks for the whole document sentiment score
+        sentences = _SentenceScores()
+        grams = DocumentNgrams(*ngrams) if ngrams is not None else None
+        pending = ''  # start of a sentence that continues in the next chunk
         with open(filename, 'r') as file:
-            text = file.read()
-
-        # Remove puncuation, digits, \n's, etc and also lowercase everything
-        cleaned_text = ''.join(filter(lambda x: x.isalpha() or x.isdigit() or x.isspace(), text))
-        cleaned_text = cleaned_text.replace('\n', ' ').lower()
-
-        # Get the list of words for the text
-        words = [word for word in cleaned_text.split() if word not in stopwords]
+            for words, text in TextAnalysis._read_words(file):
+                words = [word for word in words if word not in stopwords]
+                wordcount.update(words)
+                if grams is not None:
+                    grams.add(words)
+                if keep_text:
+                    kept.append(' '.join(words))
+                if sentiment == 'sentence':
+                    split = SENTENCE_END.split(pending + text)
+                    pending = split.pop()
+                    sentences.add(split)
+                else:
+                    raw.append(text)
 
         # Get sentiment
-        sia = SentimentIntensityAnalyzer()
-        sentiment_score = sia.polarity_scores(text)
+        if sentiment == 'sentence':
+            sentences.add([pending])
+            sentiment_score, sentence_stats = sentences.results()
+        else:
+            sentiment_score = _sentiment_analyzer().polarity_scores(''.join(raw))
 
         results = {
-            'wordcount': Counter(words),
-            'total_words': len(words),
-            'cleaned text': ' '.join(words),
+            'wordcount': wordcount,
+            'total_words': sum(wordcount.values()),
+            'cleaned text': ' '.join(chunk for chunk in kept if chunk) if keep_text else None,
             'sentiment': sentiment_score
         }
+        if sentiment == 'sentence':
+            results['sentence sentiment'] = sentence_stats
+        if grams is not None:
+            results['ngrams'] = grams.results()
 
         return results
 
     @staticmethod
-    def _load_stop_words(filename):
-        """Loads the stop words from a file into a list"""
-        stop_words = []
-        with open(filename, 'r') as file:
-            for line in file:
-                word = line.strip()
-                stop_words.append(word)
+    def _read_words(file):
+        """Read a text file in chunks, yielding the lowercased words of each chunk and the raw chunk
+        A word cut off at the end of a chunk is carried over to the next one"""
+        carry = ''
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), ''):
+            text = carry + chunk
+            carry = ''
+            if not text[-1].isspace():  # hold back the last word, it may continue in the next chunk
+                carry = text.rsplit(None, 1)[-1]
+                text = text[:len(text) - len(carry)]
+            yield TextAnalysis._tokenize(text), text
+        if carry:
+            yield TextAnalysis._tokenize(carry), carry
 
-        return stop_words
+    @staticmethod
+    def _tokenize(text):
+        """Remove puncuation (anything that isn't a letter, digit or whitespace), lowercase everything
+        and split into words"""
+        text = NOT_WORD.sub('', text)
+        if not text.isascii():  # only non-ascii text can have non-digit numbers left over
+            text = text.translate(_not_digit_table())
+        return text.lower().split()
 
-    def load_text(self, filename, stopwords_file, label=None, parser=None):  # customize parser for dataset
-        # default takes normal text file without any special formatting
-        if parser is None:
-            results = TextAnalysis._default_parser(filename, stopwords_file)
-        else:
-            results = parser(filename)
+    @staticmethod
+    def _load_stop_words(filename):
+        """Loads the stop words from a file into a frozenset for constant time lookups
+        The file is only read again if it has changed since it was last loaded"""
+        mtime = os.stat(filename).st_mtime_ns
+        cached = _stop_words.get(filename)
+        if cached is None or cached[0] != mtime:
+            with open(filename, 'r') as file:
+                cached = _stop_words[filename] = (mtime, frozenset(line.strip() for line in file))
+        return cached[1]
+
+    def load_text(self, filename, stopwords_file, label=None, parser=None, keep_text=True,
+                  sentiment='document'):  # customize parser for dataset
+        """Parse a text file and store its results under label (the file name by default)
+        The default parser (used when parser is None) takes normal text files without any special formatting.
+        It reads the file in chunks, but with the default keep_text=True and sentiment='document' it still
+        holds the whole text in memory, pass keep_text=False and sentiment='sentence' for files too large for that
+        """
+        options = self._parser_options(keep_text, sentiment)
+        results, hit = _parse((filename, stopwords_file, parser, options, self.cache_dir))
 
         if label is None:
             label = filename
 
+        self._add_results(label, results, hit)
+
+    def load_corpus(self, paths, stopwords_file, labels=None, parser=None, workers=None, keep_text=True,
+                    sentiment='document'):
+        """Load many text files, parsing them in parallel worker processes
+        :param paths: list of files or a glob pattern like 'Songs/*' (matches are loaded in sorted order)
+        :param stopwords_file: file of stop words for the default parser
+        :param labels: list of labels or a function path -> label, defaults to the file names
+        :param parser: custom parser, it has to be a module level function so it can be sent to the workers
+        :param workers: number of worker processes, defaults to the number of cores (1 parses in this process)
+        :param keep_text: whether the default parser keeps the 'cleaned text' (see load_text about memory)
+        :param sentiment: 'document' or 'sentence', how the default parser scores sentiment, with 'sentence'
+        each worker scores the sentences of its own documents in batches, so the work is only spread over the
+        processes by document and one large document is scored in a single process
+        :return stats: number of documents, seconds, documents per second, parse cache hits and,
+        for sentence sentiment, the number of sentences scored and sentences per second (documents that came
+        from the parse cache weren't scored, so their sentences aren't counted)
+        """
+        if isinstance(paths, str):
+            paths = sorted(glob.glob(paths))
+        if labels is None:
+            labels = paths
+        elif callable(labels):
+            labels = [labels(path) for path in paths]
+
+        start = time.perf_counter()
+        hits = self.cache_hits
+        options = self._parser_options(keep_text, sentiment)
+        tasks = [(path, stopwords_file, parser, options, self.cache_dir) for path in paths]
+        workers = os.cpu_count() if workers is None else workers
+        pool = mp.Pool(min(workers, len(tasks))) if workers > 1 and len(tasks) > 1 else None
+        sentences = 0  # sentences scored in this call
+        try:
+            if pool is not None:
+                # imap hands back results in the order of the tasks, so the data is the same every run
+                all_results = pool.imap(_parse, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+            else:
+                all_results = map(_parse, tasks)
+            for label, (results, hit) in zip(labels, all_results):
+                self._add_results(label, results, hit)
+                if not hit and 'sentence sentiment' in results:
+                    sentences += results['sentence sentiment']['sentences']
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        sec = time.perf_counter() - start
+        stats = {'documents': len(paths), 'seconds': sec, 'docs_per_sec': len(paths) / sec if sec > 0 else 0.0,
+                 'cache_hits': self.cache_hits - hits}
+        if sentiment == 'sentence' and parser is None:
+            stats['sentences'] = sentences
+            stats['sentences_per_sec'] = sentences / sec if sec > 0 else 0.0
+        return stats
+
+    def _parser_options(self, keep_text, sentiment):
+        """Options for the default parser"""
+        options = {'keep_text': keep_text, 'sentiment': sentiment}
+        if self.ngrams is not None:
+            options['ngrams'] = (self.ngrams.sizes, self.ngrams.window)
+        return options
+
+    def _add_results(self, label, results, hit=False):
+        """Store a parsed document's results under its label"""
+        if self.cache_dir is not None:
+            self.cache_hits += hit
+            self.cache_misses += not hit
+        if 'ngrams' in results:  # kept in the corpus index instead of per document
+            results = dict(results)
+            document = results.pop('ngrams')
+            if self.ngrams is not None:
+                self.ngrams.add(document)
         for k, v in results.items():
             self.data[k][label] = v
+        if self.dtm is not None and 'wordcount' in results:
+            self.dtm.add(label, results['wordcount'])
+
+    def wordcount_links(self, word_list=None, k=5):
+        """Long format table (label, word, count) of how often each of the most common words (or the words in
+        word_list) is in each text file, ordered by word and then by file, without zero counts"""
+        if self.dtm is not None:
+            if word_list is None:
+                word_list = [word for word, _ in self.dtm.top_k(k)]
+            labels, words, counts = self.dtm.counts_of(word_list)
+            return pd.DataFrame({'label': labels, 'word': words, 'count': counts})
 
-    def wordcount_sankey(self, word_list=None, k=5, save=False):
-        """Creates a sankey diagram of the most common words for the text files"""
         wordcounts_dict = self.data['wordcount']
 
         if word_list is None:
-            sorting_df = pd.DataFrame(
-                wordcounts_dict)
-
-            # Sum the word counts across all songs
-            total_word_counts = sorting_df.sum(axis=1)
-
-            # Sort the word counts in descending order and get the k most common
-            sorted_word_counts = total_word_counts.sort_values(ascending=False)
-            most_common = list(sorted_word_counts[:k].index)
+            # Sum the word counts across all songs and get the k most common
+            total_word_counts = Counter()
+            for wordcounts in wordcounts_dict.values():
+                total_word_counts.update(wordcounts)
+            most_common = [word for word, _ in total_word_counts.most_common(k)]
         else:
             most_common = word_list
 
-        # Initialize a dictionary to store the data, will be used in a dataframe
-        data = {'label': [], 'word': [], 'count': []}
-
-        # Go through each word in the most common words and add the number of time it's in each song to data
-        for word in most_common:
-            for label in wordcounts_dict.keys():
-                label_word_counts = wordcounts_dict[label]
-
-                if word in label_word_counts.keys():
-                    data['label'].append(label)
-                    data['word'].append(word)
-                    data['count'].append(label_word_counts[word])
+        # Counts of just the top k words (words x files), stacked into one row per word and file
+        top = pd.DataFrame({label: [wordcounts.get(word, 0) for word in most_common]
+                            for label, wordcounts in wordcounts_dict.items()},
+                           index=pd.Index(most_common, name='word'), columns=pd.Index(wordcounts_dict, name='label'))
+        links = top.stack().rename('count').reset_index()
+        return links.loc[links['count'] > 0, ['label', 'word', 'count']].reset_index(drop=True)
 
-        song_word_counts_df = pd.DataFrame(data)
+    def wordcount_sankey(self, word_list=None, k=5, save=False):
+        """Creates a sankey diagram of the most common words for the text files"""
+        song_word_counts_df = self.wordcount_links(word_list, k)
         sk.make_sankey(song_word_counts_df, 'label', 'word', vals='count')
 
-
     def generate_wordclouds(self, rows=None, cols=None, save=False):
         """Generates a subplot grid of word clouds for each text file"""
         wordcounts_dict = self.data['wordcount']
@@ -146,6 +492,49 @@ class TextAnalysis:
         else:
             plt.show()
 
+    def render_wordclouds(self, directory='wordclouds', sheet=None, max_words=200, cols=4, width=400, height=200,
+                          workers=None):
+        """Renders the word cloud of every text file in parallel worker processes, straight to image files
+        without a plotting window
+        :param directory: folder the clouds are written to as <label>.png, if there is no sheet
+        :param sheet: if given, the clouds are instead tiled into this one contact sheet image file, with labels
+        :param max_words: only the max_words most common words of each text file go into its cloud
+        :param cols: clouds per row of the contact sheet
+        :param width: width of each cloud in pixels
+        :param height: height of each cloud in pixels
+        :param workers: number of worker processes, defaults to the number of cores (1 renders in this process)
+        :return: the files written
+        """
+        wordcounts_dict = self.data['wordcount']
+        if sheet is None:
+            os.makedirs(directory, exist_ok=True)
+        tasks = []
+        for label, wordcounts in wordcounts_dict.items():
+            path = None if sheet is not None else \
+                os.path.join(directory, re.sub(r'[^\w\-]+', '_', str(label)).strip('_') + '.png')
+            tasks.append((label, dict(Counter(wordcounts).most_common(max_words)), path, width, height))
+
+        workers = os.cpu_count() if workers is None else workers
+        if workers > 1 and len(tasks) > 1:
+            with mp.Pool(min(workers, len(tasks))) as pool:
+                rendered = pool.map(_render_cloud, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+        else:
+            rendered = [_render_cloud(task) for task in tasks]
+
+        if sheet is None:
+            return rendered
+
+        # tile the clouds into one image, each with its label above it
+        rows = -(-len(rendered) // cols)  # ceiling division
+        contact = Image.new('RGB', (cols * width, rows * (height + TITLE_HEIGHT)), 'white')
+        draw = ImageDraw.Draw(contact)
+        for i, (task, image) in enumerate(zip(tasks, rendered)):
+            x, y = (i % cols) * width, (i // cols) * (height + TITLE_HEIGHT)
+            draw.text((x + 4, y + 4), str(task[0]), fill='black')
+            contact.paste(Image.fromarray(image), (x, y + TITLE_HEIGHT))
+        contact.save(sheet)
+        return [sheet]
+
     def sentiment_scores_heatmap(self, size=(10, 7), save=False):
         """Creates a heatmap showing the sentiment scores for each text file"""
 